@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""Benchmark parsing with a new libclang Index per translation unit against a
+shared, recycled Index.
+
+Usage:
+
+    python bench/index_reuse.py [-r ROUNDS] [-i INCLUDE_DIR] [FILE ...]
+
+Without files, the examples are parsed.  Prints the mean parse time per
+translation unit and the growth of the resident memory for both variants.
+"""
+
+__author__ = 'Manuel Holtgrewe <manuel.holtgrewe@fu-berlin.de>'
+
+import glob
+import optparse
+import os
+import os.path
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import linty.units as lu
+
+
+def timeParses(provider, files, args, rounds):
+    """Return mean seconds per translation unit for parsing files rounds times."""
+    start = time.time()
+    for i in range(rounds):
+        for filename in files:
+            provider.parse(filename, list(args))
+    return (time.time() - start) / (rounds * len(files))
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options] [FILE ...]')
+    parser.add_option('-r', '--rounds', dest='rounds', default=10, type='int',
+                      help='Parse all files ROUNDS times.  Default: 10.')
+    parser.add_option('-i', '--include-dir', dest='include_dirs', default=[],
+                      action='append', help='Specify include directories')
+    options, files = parser.parse_args()
+    if not files:
+        examples = os.path.join(os.path.dirname(__file__), '..', 'examples')
+        files = sorted(glob.glob(os.path.join(examples, '*.cpp')))
+    args = ['-I%s' % x for x in options.include_dirs] + ['--std=c++11']
+    variants = [('new Index per unit', lu.TranslationUnitProvider(units_per_index=1)),
+                ('shared Index', lu.TranslationUnitProvider(units_per_index=0))]
+    # Warm up the file system cache and libclang.
+    timeParses(variants[0][1], files, args, 1)
+    results = []
+    for name, provider in variants:
+        megabytes = lu.residentMegabytes()
+        seconds = timeParses(provider, files, args, options.rounds)
+        megabytes = lu.residentMegabytes() - megabytes
+        results.append(seconds)
+        print '%-20s %8.2f ms per translation unit, resident memory %+.1f MB' % (
+            name, seconds * 1000, megabytes)
+    print '%-20s %8.2f ms per translation unit (%.1f%%)' % (
+        'saving', (results[0] - results[1]) * 1000,
+        100.0 * (results[0] - results[1]) / results[0])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -62,20 +62,141 @@ call is efficient.
 #
 # o implement additional SourceLocation, SourceRange, and File methods.
 
+from array import array
 from ctypes import *
+import os
+import os.path
+import re
+
+# Path or name of the loaded libclang.
+library_path = None
+
+# Directories searched for versioned libclang builds, newest version first.
+# Only libclang.so* and libclang-<N>.so* have the C API, libclang-cpp does not.
+LIBRARY_SEARCH_PATTERNS = [
+    '/usr/lib/llvm-*/lib/libclang.so*',
+    '/usr/lib/llvm-*/lib/libclang-[0-9]*.so*',
+    '/usr/lib/x86_64-linux-gnu/libclang.so*',
+    '/usr/lib/x86_64-linux-gnu/libclang-[0-9]*.so*',
+    '/usr/lib64/libclang.so*',
+    '/usr/lib64/libclang-[0-9]*.so*',
+    '/usr/local/lib/libclang.so*',
+    '/usr/local/lib/libclang-[0-9]*.so*',
+    '/usr/local/opt/llvm/lib/libclang.dylib',
+    '/Library/Developer/CommandLineTools/usr/lib/libclang.dylib',
+]
+
+# Where the version of a library path is spelled, in order of precedence.
+VERSION_PATTERNS = [
+    re.compile(r'/llvm-(\d+(?:\.\d+)*)/'),
+    re.compile(r'/libclang-(\d+(?:\.\d+)*)\.'),
+    re.compile(r'/libclang\.so\.(\d+(?:\.\d+)*)$'),
+]
+
+def _library_cache_path():
+    base = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+    return os.path.join(base, 'linty', 'libclang-path')
+
+def _version_key(path):
+    """Sort key for library paths, by the version component of the path."""
+    for pattern in VERSION_PATTERNS:
+        match = pattern.search(path)
+        if match:
+            return [int(x) for x in match.group(1).split('.')]
+    return []
+
+def _cached_library_path():
+    """Return the library path remembered by remember_library_path() or None."""
+    try:
+        with open(_library_cache_path(), 'rb') as f:
+            return f.read().strip() or None
+    except IOError:
+        return None
 
-def get_cindex_library():
-    # FIXME: It's probably not the case that the library is actually found in
-    # this location. We need a better system of identifying and loading the
-    # CIndex library. It could be on path or elsewhere, or versioned, etc.
+def _library_candidates():
+    """
+    Yield paths or names of libclang libraries to try, in order: $LIBCLANG_PATH,
+    the library remembered in an earlier run, the unversioned default name, the
+    library next to llvm-config and versioned builds in the usual locations.
+    """
+    import glob
     import platform
+    import subprocess
+    if os.environ.get('LIBCLANG_PATH'):
+        path = os.environ['LIBCLANG_PATH']
+        if os.path.isdir(path):
+            path = os.path.join(path, 'libclang.so')
+        yield path
+    cached = _cached_library_path()
+    if cached:
+        yield cached
     name = platform.system()
     if name == 'Darwin':
-        return cdll.LoadLibrary('libclang.dylib')
+        yield 'libclang.dylib'
     elif name == 'Windows':
-        return cdll.LoadLibrary('libclang.dll')
+        yield 'libclang.dll'
     else:
-        return cdll.LoadLibrary('libclang.so')
+        yield 'libclang.so'
+    try:
+        libdir = subprocess.Popen(['llvm-config', '--libdir'], stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE).communicate()[0].strip()
+        if libdir:
+            yield os.path.join(libdir, 'libclang.so')
+    except OSError:
+        pass  # No llvm-config.
+    paths = []
+    for pattern in LIBRARY_SEARCH_PATTERNS:
+        paths += glob.glob(pattern)
+    for path in sorted(set(paths), key=_version_key, reverse=True):
+        yield path
+
+def _load_library(candidate):
+    """Return the library candidate if it loads and has the C API, else raise OSError."""
+    library = cdll.LoadLibrary(candidate)
+    try:
+        library.clang_createIndex
+    except AttributeError:
+        raise OSError('%s does not export clang_createIndex' % candidate)
+    return library
+
+def get_cindex_library():
+    """
+    Load the newest libclang that can be found. A remembered library path that
+    cannot be loaded any more is forgotten.
+    """
+    global library_path
+    errors = []
+    cached = _cached_library_path()
+    for candidate in _library_candidates():
+        try:
+            library = _load_library(candidate)
+        except OSError, e:
+            errors.append(str(e))
+            if candidate == cached:
+                try:
+                    os.unlink(_library_cache_path())
+                except OSError:
+                    pass
+            continue
+        library_path = candidate
+        return library
+    raise OSError('Could not load libclang: %s' % '; '.join(errors))
+
+def remember_library_path():
+    """
+    Remember the path of the loaded libclang for the next runs, so that they
+    do not need to search again. Only absolute paths are remembered.
+    """
+    if not library_path or not os.path.isabs(library_path) or \
+            library_path == _cached_library_path():
+        return
+    try:
+        if not os.path.isdir(os.path.dirname(_library_cache_path())):
+            os.makedirs(os.path.dirname(_library_cache_path()))
+        with open(_library_cache_path(), 'wb') as f:
+            f.write(library_path)
+    except (IOError, OSError):
+        pass  # Only a cache.
 
 # ctypes doesn't implicitly convert c_void_p to the appropriate wrapper
 # object. This is a problem, because it means that from_parameter will see an
@@ -85,6 +206,29 @@ c_object_p = POINTER(c_void_p)
 
 lib = get_cindex_library()
 
+# Maps names of optional libclang functions to whether they are available.
+capabilities = {}
+
+def _optional_function(name, argtypes, restype=None):
+    """
+    Return the libclang function name with the given signature or None if the
+    loaded libclang does not provide it.
+    """
+    try:
+        function = getattr(lib, name)
+    except AttributeError:
+        capabilities[name] = False
+        return None
+    function.argtypes = argtypes
+    if restype is not None:
+        function.restype = restype
+    capabilities[name] = True
+    return function
+
+def has_capability(name):
+    """Return whether the loaded libclang provides the function name."""
+    return capabilities.get(name, False)
+
 ### Structures and Utility Classes ###
 
 class _CXString(Structure):
@@ -146,6 +290,26 @@ class SourceLocation(Structure):
         """Get the file offset represented by this source location."""
         return self._get_instantiation()[3]
 
+    @property
+    def is_from_main_file(self):
+        """
+        Whether the location is in the main file of its translation unit, None
+        if libclang does not support this query.
+        """
+        if SourceLocation_isFromMainFile is None:
+            return None
+        return bool(SourceLocation_isFromMainFile(self))
+
+    @property
+    def is_in_system_header(self):
+        """
+        Whether the location is in a system header, e.g. one found through
+        -isystem. Always False if libclang does not support this query.
+        """
+        if SourceLocation_isInSystemHeader is None:
+            return False
+        return bool(SourceLocation_isInSystemHeader(self))
+
     def __repr__(self):
         if self.file:
             filename = self.file.name
@@ -1388,7 +1552,7 @@ class Index(ClangObject):
         """Load the translation unit from the given AST file."""
         ptr = TranslationUnit_read(self, path)
         if ptr:
-            return TranslationUnit(ptr)
+            return TranslationUnit(ptr, index=self)
         return None
 
     def parse(self, path, args = [], unsaved_files = [], options = 0):
@@ -1423,7 +1587,7 @@ class Index(ClangObject):
                                     unsaved_files_array, len(unsaved_files),
                                     options)
         if ptr:
-            return TranslationUnit(ptr)
+            return TranslationUnit(ptr, index=self)
         return None
 
 
@@ -1433,8 +1597,18 @@ class TranslationUnit(ClangObject):
     provides read-only access to its top-level declarations.
     """
 
-    def __init__(self, ptr, is_owner=True):
+    # Flags for Index.parse(), see enum CXTranslationUnit_Flags.
+    PARSE_NONE = 0
+    PARSE_DETAILED_PROCESSING_RECORD = 1
+    PARSE_INCOMPLETE = 2
+    PARSE_PRECOMPILED_PREAMBLE = 4
+    PARSE_CACHE_COMPLETION_RESULTS = 8
+    PARSE_SKIP_FUNCTION_BODIES = 64
+
+    def __init__(self, ptr, is_owner=True, index=None):
         self._is_owner = is_owner
+        # Keep the index alive as long as the translation unit.
+        self.index = index
         ClangObject.__init__(self, ptr)
 
     def __del__(self):
@@ -1451,6 +1625,28 @@ class TranslationUnit(ClangObject):
         """Get the original translation unit source file name."""
         return TranslationUnit_spelling(self)
 
+    def get_file_contents(self, file):
+        """
+        Return the contents of the given file as seen by the parser, or None
+        if libclang does not support clang_getFileContents.
+        """
+        if TranslationUnit_getFileContents is None:
+            return None
+        size = c_size_t()
+        ptr = TranslationUnit_getFileContents(self, file, byref(size))
+        if not ptr:
+            return None
+        return string_at(ptr, size.value)
+
+    def save(self, path):
+        """
+        Save the translation unit to the given file, e.g. as a precompiled
+        header when it was parsed with PARSE_INCOMPLETE. Returns True on
+        success.
+        """
+        options = TranslationUnit_defaultSaveOptions(self)
+        return TranslationUnit_save(self, path, options) == 0
+
     def get_includes(self):
         """
         Return an iterable sequence of FileInclusion objects that describe the
@@ -1499,6 +1695,9 @@ class TranslationUnit(ClangObject):
         as unsaved_files, the first items should be the filenames to be mapped
         and the second should be the contents to be substituted for the
         file. The contents may be passed as strings or file objects.
+
+        Returns True on success.  On failure, the translation unit is invalid
+        and must not be used any more.
         """
         unsaved_files_array = 0
         if len(unsaved_files):
@@ -1517,6 +1716,7 @@ class TranslationUnit(ClangObject):
         ptr = TranslationUnit_reparse(self, len(unsaved_files),
                                       unsaved_files_array,
                                       options)
+        return ptr == 0
     def codeComplete(self, path, line, column, unsaved_files = [], options = 0):
         """
         Code complete in this translation unit.
@@ -1563,7 +1763,9 @@ class File(ClangObject):
     @property
     def name(self):
         """Return the complete file and path name of the file."""
-        return _CXString_getCString(File_name(self))
+        if not hasattr(self, '_name'):
+            self._name = _CXString_getCString(File_name(self))
+        return self._name
 
     @property
     def time(self):
@@ -1616,6 +1818,12 @@ SourceLocation_getLocation = lib.clang_getLocation
 SourceLocation_getLocation.argtypes = [TranslationUnit, File, c_uint, c_uint]
 SourceLocation_getLocation.restype = SourceLocation
 
+# Only available in newer versions of libclang.
+SourceLocation_isInSystemHeader = _optional_function(
+    'clang_Location_isInSystemHeader', [SourceLocation], c_int)
+SourceLocation_isFromMainFile = _optional_function(
+    'clang_Location_isFromMainFile', [SourceLocation], c_int)
+
 # Source Range Functions
 SourceRange_getRange = lib.clang_getRange
 SourceRange_getRange.argtypes = [SourceLocation, SourceLocation]
@@ -1797,6 +2005,14 @@ TranslationUnit_spelling.argtypes = [TranslationUnit]
 TranslationUnit_spelling.restype = _CXString
 TranslationUnit_spelling.errcheck = _CXString.from_result
 
+TranslationUnit_defaultSaveOptions = lib.clang_defaultSaveOptions
+TranslationUnit_defaultSaveOptions.argtypes = [TranslationUnit]
+TranslationUnit_defaultSaveOptions.restype = c_uint
+
+TranslationUnit_save = lib.clang_saveTranslationUnit
+TranslationUnit_save.argtypes = [TranslationUnit, c_char_p, c_uint]
+TranslationUnit_save.restype = c_int
+
 TranslationUnit_dispose = lib.clang_disposeTranslationUnit
 TranslationUnit_dispose.argtypes = [TranslationUnit]
 
@@ -1822,6 +2038,19 @@ File_time = lib.clang_getFileTime
 File_time.argtypes = [File]
 File_time.restype = c_uint
 
+# Fast paths, only available in newer versions of libclang.
+TranslationUnit_getFileContents = _optional_function(
+    'clang_getFileContents', [TranslationUnit, File, POINTER(c_size_t)], c_void_p)
+_getClangVersion = _optional_function('clang_getClangVersion', [], _CXString)
+if _getClangVersion is not None:
+    _getClangVersion.errcheck = _CXString.from_result
+
+def get_version():
+    """Return the version string of the loaded libclang, None if unknown."""
+    if _getClangVersion is None:
+        return None
+    return _getClangVersion()
+
 # Code completion
 
 CodeCompletionResults_dispose = lib.clang_disposeCodeCompleteResults
@@ -1997,29 +2226,96 @@ class TokenCollection(object):
         self.source_range = source_range
         self._token_arr = token_arr
         self._num_tokens = num_tokens
-        self.tokens = tuple(Token(self.translation_unit, self._token_arr[i], self) for i in range(self._num_tokens.value))
+        # The Token objects are created on first access.
+        self._tokens = [None] * num_tokens.value
+        self._columns = None
         self.cursors = None
+        self._cursors = None
 
-    def annotate(self):
-        self._cursors = (Cursor * self._num_tokens.value)()
-        _clang_annotateTokens(self.translation_unit, self._token_arr, self._num_tokens, self._cursors)
+    @property
+    def tokens(self):
+        return tuple(self)
+
+    def columns(self):
+        """Return the TokenColumns of the tokens, computed once."""
+        if self._columns is None:
+            self._columns = TokenColumns(self)
+        return self._columns
+
+    def annotate(self, start=0, stop=None):
+        """Annotate the tokens [start, stop) with their cursors, default all."""
+        if stop is None:
+            stop = self._num_tokens.value
+        if self._cursors is None:
+            self._cursors = (Cursor * self._num_tokens.value)()
+        if start >= stop:
+            return
+        token_arr = cast(addressof(self._token_arr.contents) + start * sizeof(TokenImpl),
+                         POINTER(TokenImpl))
+        cursors = cast(addressof(self._cursors) + start * sizeof(Cursor), POINTER(Cursor))
+        _clang_annotateTokens(self.translation_unit, token_arr, stop - start, cursors)
 
     def get_cursor(self, idx):
         return self._cursors[idx]
 
     def __iter__(self):
-        return iter(self.tokens)
+        for i in xrange(len(self)):
+            yield self[i]
 
     def __getitem__(self, i):
-        return self.tokens[i]
+        if isinstance(i, slice):
+            return tuple(self[j] for j in xrange(*i.indices(len(self))))
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('token index out of range')
+        token = self._tokens[i]
+        if token is None:
+            token = self._tokens[i] = Token(self.translation_unit, self._token_arr[i], self)
+        return token
 
     def __len__(self):
-        return len(self.tokens)
+        return self._num_tokens.value
 
     def __del__(self):
         _clang_disposeTokens(self.translation_unit, self._token_arr, self._num_tokens)
 
 
+class TokenColumns(object):
+    """The attributes of the tokens of a TokenCollection in parallel arrays.
+
+    kinds holds the TokenKind values, starts and ends the file offsets of the
+    first and behind the last character, lines and columns the position of
+    the first character.  The arrays are filled in one pass over the tokens
+    without creating Token objects or spelling strings, the spellings can be
+    sliced from the file contents with the offsets.
+    """
+
+    def __init__(self, collection):
+        self.kinds = array('B')
+        self.starts = array('I')
+        self.ends = array('I')
+        self.lines = array('I')
+        self.columns = array('I')
+        translation_unit = collection.translation_unit
+        token_arr = collection._token_arr
+        f, l, c, o = c_object_p(), c_uint(), c_uint(), c_uint()
+        refs = (byref(f), byref(l), byref(c), byref(o))
+        for i in xrange(len(collection)):
+            token_impl = token_arr[i]
+            self.kinds.append(_clang_getTokenKind_value(token_impl))
+            extent = Token_extent(translation_unit, token_impl)
+            SourceLocation_loc(SourceRange_start(extent), *refs)
+            self.starts.append(o.value)
+            self.lines.append(l.value)
+            self.columns.append(c.value)
+            SourceLocation_loc(SourceRange_end(extent), *refs)
+            self.ends.append(o.value)
+
+    def __len__(self):
+        return len(self.kinds)
+
+
 def tokenize(translation_unit, source_range):
     """Tokenize a source range in the given translation unit."""
     tokens = POINTER(TokenImpl)()
@@ -2027,6 +2323,61 @@ def tokenize(translation_unit, source_range):
     num_tokens = c_uint()
     _clang_tokenize(translation_unit, source_range, tokens, byref(num_tokens))
     return TokenCollection(translation_unit, source_range, tokens, num_tokens)
+
+
+def tokenize_ends(translation_unit, source_range, first, last, following=0):
+    """Return the tokens at the ends of a source range as (head, tail, after).
+
+    head holds the first first tokens of the range, tail its last last tokens
+    and after up to following tokens behind the range.  Only windows of a few
+    lines at the ends of the range are tokenized, they grow until they hold
+    enough tokens.  The cost does not depend on the size of the range.
+    """
+    start, end = source_range.start, source_range.end
+    file = start.file
+    lines = 4
+    while True:
+        window_end = end
+        if start.line + lines < end.line:
+            window_end = SourceLocation.from_position(translation_unit, file,
+                                                      start.line + lines, 1)
+        tokens = _tokenize_window(translation_unit, start, window_end,
+                                  start.offset, end.offset)
+        if len(tokens) >= first or window_end is end:
+            break
+        lines *= 2
+    head = tokens[:first]
+    lines = 4
+    while True:
+        window_start = start
+        if end.line - lines > start.line:
+            window_start = SourceLocation.from_position(translation_unit, file,
+                                                        end.line - lines, 1)
+        tokens = _tokenize_window(translation_unit, window_start, end,
+                                  start.offset, end.offset)
+        if len(tokens) >= last or window_start is start:
+            break
+        lines *= 2
+    tail = tokens[max(0, len(tokens) - last):]
+    after = []
+    lines, window_offset = 1, end.offset
+    while len(after) < following:
+        window_end = SourceLocation.from_position(translation_unit, file, end.line + lines, 1)
+        if window_end.offset <= window_offset:
+            break  # Reached the end of the file.
+        window_offset = window_end.offset
+        after = _tokenize_window(translation_unit, end, window_end, end.offset, 2 ** 32)
+        lines *= 2
+    return head, tail, after[:following]
+
+
+def _tokenize_window(translation_unit, start, end, min_offset, max_offset):
+    """Return list of the tokens between start and end that begin in
+    [min_offset, max_offset)."""
+    collection = tokenize(translation_unit, SourceRange.from_locations(start, end))
+    starts = collection.columns().starts
+    return [collection[i] for i in xrange(len(collection))
+            if min_offset <= starts[i] < max_offset]
     
 
 
@@ -2034,6 +2385,11 @@ Token_kind = lib.clang_getTokenKind
 Token_kind.argtypes = [TokenImpl]
 Token_kind.restype = TokenKind
 
+# Returns the plain value instead of a TokenKind object, for TokenColumns.
+_clang_getTokenKind_value = lib['clang_getTokenKind']
+_clang_getTokenKind_value.argtypes = [TokenImpl]
+_clang_getTokenKind_value.restype = c_uint
+
 Token_spelling = lib.clang_getTokenSpelling
 Token_spelling.argtypes = [TranslationUnit, TokenImpl]
 Token_spelling.restype = _CXString
@@ -2063,4 +2419,4 @@ _clang_disposeTokens.argtypes = [TranslationUnit, POINTER(TokenImpl), c_uint]
 
 __all__ = ['Index', 'TranslationUnit', 'Cursor', 'CursorKind', 'Type', 'TypeKind',
            'Diagnostic', 'FixIt', 'CodeCompletionResults', 'SourceRange',
-           'SourceLocation', 'File', 'Token', 'TokenKind']
+           'SourceLocation', 'File', 'Token', 'TokenColumns', 'TokenKind']
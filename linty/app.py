@@ -9,21 +9,122 @@ import logging
 import optparse
 import sys
 
-import main as lm
+import text as ltx
+import violations as lv
+
+# The modules for the AST checks (main, daemon and watch) load libclang, they
+# are imported when needed only.
 
 def createDefaultConfig():
     return [], []
 
 
+def parseShard(parser, value):
+    """Parse shard "I/N" into 0-based (index, count)."""
+    try:
+        index, count = [int(x) for x in value.split('/')]
+    except ValueError:
+        parser.error('Invalid shard "%s", must be I/N.' % value)
+    if not 1 <= index <= count:
+        parser.error('Invalid shard "%s", must have 1 <= I <= N.' % value)
+    return index - 1, count
+
+
+def printViolations(options, vs, unsaved_files={}):
+    """Print violations like Checker.process() does, return the error count."""
+    file_reader = ltx.CachingFileReader()
+    for path, contents in unsaved_files.items():
+        file_reader.setContents(path, contents)
+    return lv.reportViolations(vs, file_reader, options)
+
+
+def merge(options, paths):
+    """Merge result files and print violations like a single run would."""
+    return printViolations(options, lv.readResults(paths))
+
+
+def readStdin(options):
+    """Return dict with the unsaved file read from stdin, if any."""
+    if not options.stdin_filename:
+        return {}
+    return {options.stdin_filename: sys.stdin.read()}
+
+
+def checkOnServer(options, unsaved_files):
+    """Let the linty server check the files and print the violations."""
+    import daemon as ld
+    client = ld.LintClient(options.socket)
+    vs = set(client.check(options.filenames, options.include_dirs, unsaved_files,
+                          options.dep_include_dirs))
+    return printViolations(options, vs, unsaved_files)
+
+
 def main(ast_checks, file_checks):
     # Setup option parser.
     parser = optparse.OptionParser()
     parser.add_option('-f', '--file', dest='filenames', default=[],
                       action='append', metavar='FILE',
-                      help='Compilation unit File(s) (*.c, *.cpp, ...).')
+                      help='Compilation unit File(s) (*.c, *.cpp, ...).  With --text-only '
+                      'also directories.')
     parser.add_option('-i', '--include-dir', dest='include_dirs', default=[],
                       type='string', help='Specify include directories',
                       action='append')
+    parser.add_option('-d', '--dep-include-dir', dest='dep_include_dirs', default=[],
+                      type='string', action='append', metavar='DIR',
+                      help='Include directory of a dependency, not checked and passed as '
+                      '-isystem.')
+    parser.add_option('-p', '--compile-commands', dest='compile_commands', default=None,
+                      metavar='PATH', help='Take the flags of each translation unit from the '
+                      'compile_commands.json at PATH or in the directory PATH.')
+    parser.add_option('-j', '--jobs', dest='jobs', default=1, type='int',
+                      metavar='N', help='Check N translation units in parallel, 0 for one per CPU.')
+    parser.add_option('--units-per-index', dest='units_per_index', default=64, type='int',
+                      metavar='N', help='Recycle the libclang Index after N translation units, '
+                      '0 for never.  Default: 64.')
+    parser.add_option('--megabytes-per-index', dest='megabytes_per_index', default=1024,
+                      type='int', metavar='M', help='Recycle the libclang Index when memory '
+                      'grew by M MB, 0 for never.  Default: 1024.')
+    parser.add_option('--history', dest='history', default=None,
+                      metavar='FILE', help='File with translation unit runtimes of earlier '
+                      'runs, used for scheduling.  Default: history.json in the --cache-dir, '
+                      'if given, no history otherwise.')
+    parser.add_option('--shard', dest='shard', default=None, metavar='I/N',
+                      help='Only check the I-th of N shards of the translation units (1 <= I <= N).')
+    parser.add_option('--shard-weight', dest='shard_weight', default='size',
+                      type='choice', choices=['count', 'size', 'cost'],
+                      help='Balance shards by file count, size or recorded cost (needs '
+                      'the same history on all machines).  Default: size.')
+    parser.add_option('--cache-dir', dest='cache_dir', default=None, metavar='DIR',
+                      help='Cache the text check results in DIR across runs.')
+    parser.add_option('--cache-size', dest='cache_size', default=256, type='int',
+                      metavar='MB', help='Size budget of the cache, least recently used '
+                      'results are evicted first.  Default: 256.')
+    parser.add_option('--unity', dest='unity', default=0, type='int', metavar='N',
+                      help='Parse small translation units in batches of N as one unity '
+                      'translation unit.')
+    parser.add_option('--text-only', dest='text_only', default=False, action='store_true',
+                      help='Only run the text checks on the files and directories given '
+                      'with -f or, without -f, the include directories.  Does not load '
+                      'libclang.')
+    parser.add_option('--shallow', dest='shallow', default=False, action='store_true',
+                      help='Replace headers outside the include directories, e.g. the '
+                      'STL, by empty stubs for faster parsing.')
+    parser.add_option('--pch', dest='pch', default=False, action='store_true',
+                      help='Precompile the leading includes shared by translation units.  '
+                      'Stored in the cache directory or .linty_cache.')
+    parser.add_option('--ast-cache', dest='ast_cache', default=False, action='store_true',
+                      help='Save parsed translation units and load them instead of parsing '
+                      'unchanged files again.  Stored in the cache directory or .linty_cache.')
+    parser.add_option('-o', '--result-file', dest='result_file', default=None,
+                      metavar='FILE', help='Write violations to FILE for "merge".')
+    parser.add_option('--socket', dest='socket', default=None, metavar='PATH',
+                      help='Unix socket of the linty server.  Check on the server '
+                      'instead of locally or, with "serve", start the server.')
+    parser.add_option('--stdin-filename', dest='stdin_filename', default=None,
+                      metavar='PATH', help='Read the contents of PATH from stdin, e.g. an '
+                      'unsaved editor buffer.  PATH is checked if no -f is given.')
+    parser.add_option('--watch', dest='watch', default=False, action='store_true',
+                      help='Recheck files when they or their includes change.')
     parser.add_option('-q', '--quiet', dest='verbosity', default=1,
                       action='store_const', const=0, help='Fewer message.')
     parser.add_option('-v', '--verbose', dest='verbosity', default=1,
@@ -34,8 +135,14 @@ def main(ast_checks, file_checks):
                       action='store_const', const=True, help='Ignore "// nolint" statements.')
     parser.add_option('--dont-show-source', dest='show_source', default=True,
                       action='store_const', const=False, help='Suppress source line display')
+    parser.set_usage('%prog [options]\n       %prog [options] merge RESULT_FILE...\n'
+                     '       %prog --socket PATH serve')
     # Parse command line.
     options, args = parser.parse_args()
+    if options.shard:
+        options.shard = parseShard(parser, options.shard)
+    if options.stdin_filename and not options.filenames:
+        options.filenames = [options.stdin_filename]
 
     # Configure logging.
     LEVELS = {0 : logging.ERROR,
@@ -43,10 +150,44 @@ def main(ast_checks, file_checks):
               2 : logging.DEBUG}
     logging.basicConfig(level=LEVELS[options.verbosity], format='%(message)s')
 
+    # Merge result files of shards or run as server.
+    if args and args[0] == 'merge':
+        return merge(options, args[1:])
+    elif args and args[0] == 'serve':
+        if not options.socket:
+            parser.error('The serve command needs --socket.')
+        import daemon as ld
+        return ld.LintServer(options.socket, ast_checks, file_checks).serve()
+    elif args:
+        parser.error('Unknown command %s.' % args[0])
+
+    # Let a running server do the checking, the client does not load libclang.
+    unsaved_files = readStdin(options)
+    if options.socket:
+        return checkOnServer(options, unsaved_files)
+
+    # Run the text checks only, without parsing.
+    if options.text_only:
+        text_checker = ltx.TextChecker(options, file_checks)
+        for path, contents in unsaved_files.items():
+            text_checker.file_reader.setContents(path, contents)
+        return text_checker.process(options.filenames or options.include_dirs)
+
+    import main as lm
+    logging.debug('Using libclang %s (%s).', lm.ci.library_path, lm.ci.get_version())
+    lm.ci.remember_library_path()
+
+    # Keep checking changed files.
+    if options.watch:
+        import watch as lwatch
+        return lwatch.Watcher(options, ast_checks, file_checks).run()
+
     # Setup objects for the actual checking.
     audit_listener = lm.AuditListener()
     checker = lm.Checker(options, ast_checks, file_checks)
     checker.listeners.append(audit_listener)
+    for path, contents in unsaved_files.items():
+        checker.setUnsavedFile(path, contents)
     # Run the checker.
     res = checker.process(options.filenames)
     return res
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+"""Persistent on-disk caches for check results.
+
+The FileCheckCache stores the violations of the text checks keyed by the hash
+of the file contents, the configuration of the checks and the linty version.
+A stat index maps paths to their hash, so unchanged files are neither read nor
+hashed again.
+
+The AstResultCache stores the results of walking translation units together
+with the files they included, so unchanged translation units are neither
+parsed nor walked again.
+
+Each cache has a size budget, the least recently used entries are evicted
+first.
+"""
+
+__author__ = 'Manuel Holtgrewe <manuel.holtgrewe@fu-berlin.de>'
+
+import hashlib
+import json
+import logging
+import os
+import os.path
+
+import version
+
+
+def checksFingerprint(checks):
+    """Return hash of the configuration of checks and the linty version."""
+    h = hashlib.sha1(version.__version__)
+    for check in checks:
+        h.update('\0' + check.fingerprint())
+    return h.hexdigest()
+
+
+def fileStamp(path):
+    """Return [size, mtime] of the file at path or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime]
+
+
+def atomicWrite(path, write):
+    """Write the file at path with write(tmp_path), atomically replacing it.
+
+    write writes a temporary file next to path, concurrent processes use
+    different ones.  If write returns False then path is left alone and
+    False is returned.  Missing directories are created.
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    if write(tmp_path) is False:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        return False
+    os.rename(tmp_path, path)
+    return True
+
+
+def atomicWriteJson(path, data, **kwargs):
+    """Write data as JSON to path with atomicWrite(), kwargs go to json.dump()."""
+    def write(tmp_path):
+        with open(tmp_path, 'wb') as f:
+            json.dump(data, f, **kwargs)
+    atomicWrite(path, write)
+
+
+class DiskCache(object):
+    """Directory of JSON entries with a size budget and LRU eviction.
+
+    Entries are touched when read, the ones with the oldest modification time
+    are evicted when the total size exceeds max_bytes.  Other files can be
+    stored next to the entries with filePath() and fileAdded().
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._total_bytes = None
+
+    def get(self, key):
+        """Return the data stored for key or None."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = json.load(f)
+            os.utime(path, None)  # Mark as recently used.
+            return data
+        except (IOError, OSError, ValueError):
+            return None
+
+    def put(self, key, data):
+        """Store data for key, evict old entries if over budget."""
+        path = self._path(key)
+        atomicWriteJson(path, data)
+        self.fileAdded(path)
+
+    def filePath(self, name):
+        """Return path for storing the file with the given name."""
+        return os.path.join(self.directory, name[:2], name)
+
+    def fileAdded(self, path):
+        """Account for the file written to path, evict if over budget."""
+        self._total_bytes = self.totalBytes() + os.path.getsize(path)
+        if self._total_bytes > self.max_bytes:
+            self.evict()
+
+    def totalBytes(self):
+        if self._total_bytes is None:
+            self._total_bytes = sum(size for _, size, _ in self._entries())
+        return self._total_bytes
+
+    def evict(self):
+        """Remove least recently used entries until 90% of the budget is used."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            if total <= 0.9 * self.max_bytes:
+                break
+            logging.debug('Evicting cache entry %s.', path)
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass  # Removed concurrently.
+        self._total_bytes = total
+
+    def _entries(self):
+        """Return list of (mtime, size, path) of all entries."""
+        result = []
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            for name in filenames:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                result.append((st.st_mtime, st.st_size, path))
+        return result
+
+    def _path(self, key):
+        return self.filePath(key + '.json')
+
+
+class FileCheckCache(object):
+    """Cache for the violations of the text checks.
+
+    The violations are stored without the file name so files with the same
+    contents share entries.
+    """
+
+    def __init__(self, directory, file_checks, max_bytes=256 * 1024 * 1024):
+        self.fingerprint = checksFingerprint(file_checks)
+        self.entries = DiskCache(os.path.join(directory, 'files'), max_bytes)
+        self._stat_index_path = os.path.join(directory, 'stat-index.json')
+        self._stat_index = {}
+        try:
+            with open(self._stat_index_path, 'rb') as f:
+                self._stat_index = json.load(f)
+        except (IOError, ValueError):
+            pass
+
+    def digest(self, path, file_reader):
+        """Return content hash of file, only read and hash it if it changed.
+
+        Unchanged means same size and modification time as recorded in the
+        stat index.  Unsaved files of the file_reader are always hashed.
+        """
+        path = os.path.abspath(path)
+        if file_reader.unsaved_files.has_key(path):
+            return hashlib.sha1(file_reader.unsaved_files[path]).hexdigest()
+        stamp = fileStamp(path)
+        entry = self._stat_index.get(path)
+        if entry and entry[0] == stamp:
+            return entry[1]
+        digest = hashlib.sha1(file_reader.readFile(path)[1]).hexdigest()
+        self._stat_index[path] = [stamp, digest]
+        return digest
+
+    def get(self, digest):
+        """Return violations for each check or None if not cached.
+
+        The violations of each check are given as a list of (rule_id, line,
+        column, msg) lists without the file name.
+        """
+        data = self.entries.get(self._key(digest))
+        if not isinstance(data, list):
+            return None  # Missing or written by an older version.
+        return data
+
+    def put(self, digest, violations):
+        """Store the list of RuleViolation lists for each check."""
+        data = [[[v.rule_id, v.line, v.column, v.msg] for v in sorted(vs)]
+                for vs in violations]
+        self.entries.put(self._key(digest), data)
+
+    def save(self):
+        """Write the stat index."""
+        atomicWriteJson(self._stat_index_path, self._stat_index)
+
+    def _key(self, digest):
+        return hashlib.sha1(digest + self.fingerprint).hexdigest()
+
+
+class AstResultCache(object):
+    """Cache for the results of walking translation units.
+
+    Like a depfile of make or ninja, each entry records the main file and all
+    files it included with their sizes and modification times, and is only
+    used while none of them changed.  Entries are keyed by the main file, the
+    clang arguments, the files that are walked, the configuration of the AST
+    checks and clang_version, the version of libclang.
+    """
+
+    def __init__(self, directory, ast_checks, max_bytes=256 * 1024 * 1024,
+                 clang_version=None):
+        self.fingerprint = checksFingerprint(ast_checks)
+        self.clang_version = clang_version or ''
+        self.entries = DiskCache(os.path.join(directory, 'units'), max_bytes)
+
+    def key(self, filename, args, blocked_files=(), only_files=None):
+        """Return the key for walking filename parsed with args.
+
+        blocked_files and only_files select the walked files as for the
+        VisitAllowedFilter.
+        """
+        if only_files is not None:
+            only_files = sorted(only_files)
+        h = hashlib.sha1(self.fingerprint)
+        h.update('\0' + self.clang_version)
+        h.update('\0' + os.path.abspath(filename))
+        h.update('\0' + repr(list(args)))
+        h.update('\0' + repr(sorted(blocked_files)))
+        h.update('\0' + repr(only_files))
+        return h.hexdigest()
+
+    def get(self, key):
+        """Return (violations, seen_files) or None if missing or outdated.
+
+        The violations of each check are given as lists from
+        violationToList().
+        """
+        data = self.entries.get(key)
+        if data is None:
+            return None
+        for path, stamp in data['dependencies']:
+            if fileStamp(path) != stamp:
+                logging.debug('Cached result outdated by %s.', path)
+                return None
+        return data['violations'], set(str(x) for x in data['seen_files'])
+
+    def put(self, key, dependencies, violations, seen_files):
+        """Store the results of a walk, depending on the given files."""
+        dependencies = sorted(set(os.path.abspath(x) for x in dependencies))
+        data = {'dependencies': [[x, fileStamp(x)] for x in dependencies],
+                'violations': violations,
+                'seen_files': sorted(seen_files)}
+        self.entries.put(key, data)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""Tests for the cache module in nosetests style."""
+
+import os
+import os.path
+
+import cache as lc
+import test_utils as lt
+
+
+class FakeCheck(object):
+    def __init__(self, config):
+        self.config = config
+
+    def fingerprint(self):
+        return 'FakeCheck(%r)' % self.config
+
+
+class FakeViolation(object):
+    def __init__(self, line):
+        self.rule_id = 'fake.rule'
+        self.line = line
+        self.column = 1
+        self.msg = 'Fake violation.'
+
+
+class CountingFileReader(object):
+    def __init__(self):
+        self.unsaved_files = {}
+        self.reads = 0
+
+    def readFile(self, path):
+        self.reads += 1
+        with open(path, 'rb') as f:
+            contents = f.read()
+        return path, contents, contents.splitlines()
+
+
+def test_file_check_cache_roundtrip():
+    with lt.temporaryTree({'file.cpp': 'int x;\n'}) as root:
+        path = os.path.join(root, 'file.cpp')
+        reader = CountingFileReader()
+        cache = lc.FileCheckCache(os.path.join(root, 'cache'), [FakeCheck(1)])
+        digest = cache.digest(path, reader)
+        assert cache.get(digest) is None
+        cache.put(digest, [[FakeViolation(3)]])
+        cache.save()
+        # Unchanged files are not read again.
+        cache = lc.FileCheckCache(os.path.join(root, 'cache'), [FakeCheck(1)])
+        assert cache.digest(path, reader) == digest
+        assert reader.reads == 1
+        assert cache.get(digest) == [[['fake.rule', 3, 1, 'Fake violation.']]]
+        # Other check configurations do not share results.
+        cache = lc.FileCheckCache(os.path.join(root, 'cache'), [FakeCheck(2)])
+        assert cache.get(digest) is None
+
+
+def test_atomic_write_keeps_file_on_failure():
+    with lt.temporaryTree({'a': 'old'}) as root:
+        path = os.path.join(root, 'a')
+        def fail(tmp_path):
+            with open(tmp_path, 'wb') as f:
+                f.write('partial')
+            return False
+        assert not lc.atomicWrite(path, fail)
+        assert os.listdir(root) == ['a']
+        with open(path, 'rb') as f:
+            assert f.read() == 'old'
+        lc.atomicWriteJson(os.path.join(root, 'b', 'c.json'), {'x': 1})
+        with open(os.path.join(root, 'b', 'c.json'), 'rb') as f:
+            assert f.read() == '{"x": 1}'
+
+
+def test_disk_cache_evicts_least_recently_used():
+    with lt.temporaryTree({}) as root:
+        cache = lc.DiskCache(root, 100)
+        cache.put('aa', 'x' * 40)
+        cache.put('bb', 'x' * 40)
+        os.utime(cache._path('aa'), (1, 1))
+        os.utime(cache._path('bb'), (2, 2))
+        assert cache.get('aa') is not None  # Now most recently used.
+        cache.put('cc', 'x' * 40)
+        assert cache.get('aa') is not None
+        assert cache.get('bb') is None
+        assert cache.get('cc') is not None
+
+
+def test_ast_result_cache_tracks_dependencies():
+    with lt.temporaryTree({'main.cpp': 'int x;\n', 'header.h': 'int x;\n'}) as root:
+        main = os.path.join(root, 'main.cpp')
+        header = os.path.join(root, 'header.h')
+        cache = lc.AstResultCache(os.path.join(root, 'cache'), [FakeCheck(1)])
+        key = cache.key(main, ['-I%s' % root])
+        assert key != cache.key(main, ['-I%s' % root, '-DX'])
+        assert key != cache.key(main, ['-I%s' % root], only_files=[header])
+        other_clang = lc.AstResultCache(os.path.join(root, 'cache'), [FakeCheck(1)],
+                                        clang_version='clang version 99.0.0')
+        assert key != other_clang.key(main, ['-I%s' % root])
+        violations = [[['fake.rule', header, 1, 1, 'Fake violation.']]]
+        cache.put(key, [main, header], violations, set([main, header]))
+        assert cache.get(key) == (violations, set([main, header]))
+        # Changing an included file invalidates the entry.
+        with open(header, 'ab') as f:
+            f.write('int y;\n')
+        assert cache.get(key) is None
@@ -10,15 +10,59 @@ from __future__ import with_statement
 __author__ = 'Manuel Holtgrewe <manuel.holtgrewe@fu-berlin.de>'
 
 import bisect
-import sys
+import importlib
+import logging
 import re
 
 import violations as lv
 
 
+def describeConfig(value):
+    """Return string describing a configuration value, stable across runs.
+
+    Objects are described by their class and attributes, compiled regular
+    expressions by their pattern.
+    """
+    if hasattr(value, 'pattern'):
+        return repr(value.pattern)
+    if isinstance(value, (list, tuple)):
+        return '[%s]' % ', '.join(describeConfig(x) for x in value)
+    if isinstance(value, dict):
+        return '{%s}' % ', '.join('%r: %s' % (k, describeConfig(v))
+                                  for k, v in sorted(value.items()))
+    if hasattr(value, '__dict__'):
+        return '%s.%s(%s)' % (type(value).__module__, type(value).__name__,
+                              describeConfig(value.__dict__))
+    return repr(value)
+
+
+class LazyModule(object):
+    """Stand-in for the module name, imported on first attribute access.
+
+    The check modules access clang.cindex through it, so configurations can
+    create checks without loading libclang, e.g. for text-only runs.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        # Only called for attributes of the module.
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
 class Check(object):
     """Base class for all checks."""
 
+    # Attributes that hold state of a run and not configuration.
+    RUNTIME_ATTRIBUTES = ('violations', 'file_reader')
+    # Whether the check looks at the AST of function bodies.  If no check
+    # does, function bodies are skipped when parsing.
+    NEEDS_FUNCTION_BODIES = False
+
     def __init__(self):
         self.violations = set()
         self.file_reader = None
@@ -30,6 +74,16 @@ class Check(object):
 
     def setFileReader(self, file_reader):
         self.file_reader = file_reader
+
+    def fingerprint(self):
+        """Return string describing the check and its configuration.
+
+        Cached results are only reused for checks with the same fingerprint.
+        """
+        config = dict((k, v) for k, v in self.__dict__.items()
+                      if k not in self.RUNTIME_ATTRIBUTES)
+        return '%s.%s(%s)' % (type(self).__module__, type(self).__name__,
+                              describeConfig(config))
     
     def beginProcessing(self):
         pass
@@ -37,6 +91,19 @@ class Check(object):
         pass
 
 
+def beginProcessing(checks, file_reader):
+    """Reset the violations of checks and start a run reading with file_reader."""
+    for check in checks:
+        check.violations.clear()
+        check.setFileReader(file_reader)
+        check.beginProcessing()
+
+
+def needsFunctionBodies(checks):
+    """Return True if one of the AST checks looks at function bodies."""
+    return any(check.NEEDS_FUNCTION_BODIES for check in checks)
+
+
 class HeaderCheck(Check):
     """Check the header of a file.
 
@@ -59,7 +126,8 @@ class HeaderCheck(Check):
 
     def processFiltered(self, path, fcontents, flines):
         if len(flines) < len(self.lines):
-            print >>sys.stderr, '%s: missing header.' % path
+            v = lv.RuleViolation('style.header', path, 1, 1, 'Missing header!')
+            self.violations.add(v)
             return
         for i in range(0, len(self.lines)):
             line_is_good = self.checkLine(i, self.lines[i], flines[i])
@@ -218,6 +286,14 @@ class TodoCommentChecker(Check):
 
 
 class TreeCheck(Check):
+    RUNTIME_ATTRIBUTES = Check.RUNTIME_ATTRIBUTES + ('token_index',)
+    NEEDS_FUNCTION_BODIES = True
+    # The tokens.TokenIndex of the translation unit being walked.
+    token_index = None
+
+    def setTokenIndex(self, token_index):
+        self.token_index = token_index
+
     def beginTree(self, node):
         logging.debug('Starting tree %s', node.spelling)
 
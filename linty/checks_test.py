@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+"""Tests for the checks module in nosetests style."""
+
+import sys
+
+import checks as lc
+import indent as li
+import whitespace as lw
+
+
+def test_needs_function_bodies():
+    # Function bodies are only skipped without an indentation check.
+    assert not lc.needsFunctionBodies([])
+    assert not lc.needsFunctionBodies([lw.WhitespaceCheck()])
+    assert lc.needsFunctionBodies([lw.WhitespaceCheck(), li.IndentationCheck()])
+    assert lc.needsFunctionBodies([li.IndentationCheck()])
+
+
+def test_lazy_module_delegates_to_module():
+    module = lc.LazyModule('colorsys')
+    assert 'colorsys' not in sys.modules
+    assert module.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+    assert module.rgb_to_hsv is sys.modules['colorsys'].rgb_to_hsv
+    # Attributes are looked up in the module, not copied.
+    assert 'rgb_to_hsv' not in vars(module)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""Read the compiler flags of translation units from compile_commands.json.
+
+Build systems such as CMake (with CMAKE_EXPORT_COMPILE_COMMANDS) write a JSON
+compilation database with the command that compiles each translation unit.
+The CompilationDatabase turns these commands into libclang arguments, so
+each translation unit is parsed with its real flags.
+"""
+
+__author__ = 'Manuel Holtgrewe <manuel.holtgrewe@fu-berlin.de>'
+
+import json
+import logging
+import os
+import os.path
+import shlex
+
+# Flags that do not influence parsing, the ones in the second set consume the
+# next argument as well.
+IGNORED_FLAGS = set(['-c', '-MD', '-MMD', '-MP', '-M', '-MM'])
+IGNORED_FLAGS_WITH_VALUE = set(['-o', '-MF', '-MT', '-MQ'])
+# Flags with a path that is relative to the directory of the entry, either
+# joined to the flag or as the next argument.  Longest first, so that e.g.
+# -include-pch is not taken for -include.
+PATH_FLAGS = ['-include-pch', '-iframework', '-idirafter', '--sysroot=', '-isysroot',
+              '-isystem', '-imacros', '-include', '-iquote', '-I', '-F']
+
+
+class CompilationDatabase(object):
+    """The compile_commands.json at path, path can also be its directory."""
+
+    def __init__(self, path):
+        if os.path.isdir(path):
+            path = os.path.join(path, 'compile_commands.json')
+        self.path = path
+        self.entries = {}  # Absolute path -> list of arguments.
+        self._flag_sets = {}  # For sharing identical argument lists.
+        with open(path, 'rb') as f:
+            for entry in json.load(f):
+                directory = str(entry['directory'])
+                filename = os.path.abspath(os.path.join(directory, str(entry['file'])))
+                if entry.has_key('arguments'):
+                    command = [str(x) for x in entry['arguments']]
+                else:
+                    command = shlex.split(str(entry['command']))
+                args = tuple(self._clean(command, directory, filename))
+                self.entries[filename] = self._flag_sets.setdefault(args, args)
+        logging.info('Read %d translation units with %d flag sets from %s.',
+                     len(self.entries), len(self._flag_sets), path)
+
+    def args(self, filename):
+        """Return list of libclang arguments for filename, None if unknown."""
+        args = self.entries.get(os.path.abspath(filename))
+        if args is None:
+            return None
+        return list(args)
+
+    def groups(self, files):
+        """Return list of lists of files with identical flags, in order of files.
+
+        All files without entry form one more group, in the place of the
+        first of them.
+        """
+        groups = {}
+        order = []
+        for filename in files:
+            key = self.entries.get(os.path.abspath(filename))
+            if not groups.has_key(key):
+                groups[key] = []
+                order.append(key)
+            groups[key].append(filename)
+        return [groups[k] for k in order]
+
+    def _clean(self, command, directory, filename):
+        """Return the arguments of command relevant for parsing filename.
+
+        Relative paths are made absolute instead of passing -working-directory,
+        with which libclang changes the working directory of the process.
+        """
+        args = []
+        start = 0
+        while start < len(command) and not command[start].startswith('-'):
+            start += 1  # The compiler and wrappers, e.g. "ccache g++".
+        skip = False
+        path_flag = False
+        for arg in command[start:]:
+            if skip:
+                skip = False
+            elif path_flag:
+                path_flag = False
+                args.append(os.path.join(directory, arg))
+            elif arg in PATH_FLAGS:
+                path_flag = True
+                args.append(arg)
+            elif self._pathFlag(arg):
+                flag = self._pathFlag(arg)
+                args.append(flag + os.path.join(directory, arg[len(flag):]))
+            elif arg in IGNORED_FLAGS:
+                pass
+            elif arg in IGNORED_FLAGS_WITH_VALUE:
+                skip = True
+            elif arg.startswith('-o') and len(arg) > 2:
+                pass
+            elif not arg.startswith('-') and \
+                    os.path.abspath(os.path.join(directory, arg)) == filename:
+                pass  # The translation unit itself.
+            else:
+                args.append(arg)
+        return args
+
+    def _pathFlag(self, arg):
+        """Return the flag of PATH_FLAGS that arg starts with, None if none."""
+        for flag in PATH_FLAGS:
+            if arg.startswith(flag):
+                return flag
+        return None
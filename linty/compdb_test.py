@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""Tests for the compdb module in nosetests style."""
+
+import json
+import os
+import os.path
+
+import compdb as lcdb
+import test_utils as lt
+
+
+def _writeDatabase(root, entries):
+    with open(os.path.join(root, 'compile_commands.json'), 'wb') as f:
+        json.dump([dict(e, directory=root) for e in entries], f)
+
+
+def test_compilation_database_args():
+    with lt.temporaryTree({}) as root:
+        _writeDatabase(root, [
+            {'file': 'a.cpp', 'command': 'c++ -Iinclude -DX="a b" -std=c++14 -o a.o -c a.cpp'},
+            {'file': 'b.cpp', 'arguments': ['c++', '-MD', '-MF', 'b.d', '-Iinclude', 'b.cpp']},
+            {'file': 'c.cpp', 'command': 'ccache g++ -DC -c c.cpp'},
+            {'file': 'd.cpp', 'arguments': ['c++', '-I', '../x', '-isystem', '/usr/y',
+                                            '-include-pch', 'd.pch', '-iquotez', 'd.cpp']},
+            ])
+        database = lcdb.CompilationDatabase(root)
+        include = os.path.join(root, 'include')
+        assert database.args(os.path.join(root, 'a.cpp')) == [
+            '-I' + include, '-DX=a b', '-std=c++14']
+        assert database.args(os.path.join(root, 'b.cpp')) == ['-I' + include]
+        assert database.args(os.path.join(root, 'c.cpp')) == ['-DC']
+        assert database.args(os.path.join(root, 'd.cpp')) == [
+            '-I', os.path.join(root, '../x'), '-isystem', '/usr/y',
+            '-include-pch', os.path.join(root, 'd.pch'), '-iquote' + os.path.join(root, 'z')]
+        assert database.args(os.path.join(root, 'e.cpp')) is None
+
+
+def test_compilation_database_groups():
+    with lt.temporaryTree({}) as root:
+        _writeDatabase(root, [
+            {'file': 'a.cpp', 'command': 'c++ -DA -c a.cpp'},
+            {'file': 'b.cpp', 'command': 'c++ -DB -c b.cpp'},
+            {'file': 'c.cpp', 'command': 'c++ -DA -c c.cpp'},
+            ])
+        database = lcdb.CompilationDatabase(root)
+        files = [os.path.join(root, x) for x in ('a.cpp', 'b.cpp', 'c.cpp', 'd.cpp')]
+        assert database.groups(files) == [[files[0], files[2]], [files[1]], [files[3]]]
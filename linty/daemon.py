@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""Long-running linty server with warm libclang state and its client.
+
+The LintServer listens on a Unix socket.  It keeps libclang loaded and the
+recently parsed translation units alive in a ReparsingProvider, so repeated
+checks only pay for reparsing changed files.  The LintClient sends check
+requests and receives the violations.
+
+The protocol is line-based JSON.  The client sends one request object:
+
+    {"files": [...], "include_dirs": [...], "dep_include_dirs": [...],
+     "unsaved_files": {path: contents}}
+
+The contents of unsaved files are sent as Latin-1 decoded strings so that any
+bytes survive the round trip.
+
+The server answers with one line per violation and a final line:
+
+    {"violation": [rule_id, file, line, column, msg]}
+    {"done": true, "count": 1}
+
+If the check fails, the final line is {"error": "message"} instead.
+"""
+
+__author__ = 'Manuel Holtgrewe <manuel.holtgrewe@fu-berlin.de>'
+
+import json
+import logging
+import os
+import os.path
+import socket
+
+import violations as lv
+
+# The server modules (main and units) load libclang, they are imported by the
+# LintServer only, so that the LintClient runs without libclang.
+
+
+class ServerError(Exception):
+    """Raised by the LintClient when the server reports an error."""
+
+
+class RequestOptions(object):
+    """Checker options for a request received by the server."""
+
+    def __init__(self, request):
+        self.include_dirs = [str(x) for x in request.get('include_dirs', [])]
+        self.dep_include_dirs = [str(x) for x in request.get('dep_include_dirs', [])]
+        self.ignore_nolint = False
+        self.show_source = False
+        self.ignore_rules = []
+        # Translation units have to stay in the server process.
+        self.jobs = 1
+
+
+class LintServer(object):
+    """Serve check requests on the Unix socket at socket_path."""
+
+    def __init__(self, socket_path, ast_checks, file_checks, max_units=32):
+        self.socket_path = socket_path
+        self.ast_checks = ast_checks
+        self.file_checks = file_checks
+        import units as lu
+        self.provider = lu.ReparsingProvider(max_units)
+
+    def serve(self):
+        """Serve requests until a shutdown request is received."""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # Stale socket of a previous server.
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.bind(self.socket_path)
+            sock.listen(5)
+            logging.info('Listening on %s.', self.socket_path)
+            running = True
+            while running:
+                conn, _ = sock.accept()
+                try:
+                    running = self.handle(conn)
+                finally:
+                    conn.close()
+        finally:
+            sock.close()
+            os.unlink(self.socket_path)
+        return 0
+
+    def handle(self, conn):
+        """Handle the request on conn, return False on shutdown request."""
+        import main as lm
+        stream = conn.makefile('rwb')
+        try:
+            request = json.loads(stream.readline())
+            if request.get('shutdown'):
+                logging.info('Shutting down.')
+                self._send(stream, {'done': True, 'count': 0})
+                return False
+            logging.info('Checking %s.', ', '.join(request['files']))
+            checker = lm.Checker(RequestOptions(request), self.ast_checks,
+                                 self.file_checks, self.provider)
+            for path, contents in request.get('unsaved_files', {}).items():
+                checker.setUnsavedFile(str(path), contents.encode('latin-1'))
+            vs = checker.run([str(x) for x in request['files']])
+        except Exception, e:
+            logging.exception('Check failed.')
+            self._send(stream, {'error': str(e)})
+            return True
+        for v in sorted(vs):
+            self._send(stream, {'violation': lv.violationToList(v)})
+        self._send(stream, {'done': True, 'count': len(vs)})
+        return True
+
+    def _send(self, stream, data):
+        stream.write(json.dumps(data) + '\n')
+        stream.flush()
+
+
+class LintClient(object):
+    """Send requests to the LintServer listening at socket_path."""
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+
+    def check(self, files, include_dirs, unsaved_files={}, dep_include_dirs=()):
+        """Check files on the server, yield violations as they arrive.
+
+        unsaved_files maps paths to in-memory contents to check instead of
+        the files on disk.
+        """
+        request = {'files': [os.path.abspath(x) for x in files],
+                   'include_dirs': [os.path.abspath(x) for x in include_dirs],
+                   'dep_include_dirs': [os.path.abspath(x) for x in dep_include_dirs],
+                   'unsaved_files': dict((os.path.abspath(path), contents.decode('latin-1'))
+                                         for path, contents in unsaved_files.items())}
+        for data in self._request(request):
+            if data.has_key('violation'):
+                yield lv.violationFromList(data['violation'])
+
+    def shutdown(self):
+        """Ask the server to shut down."""
+        for data in self._request({'shutdown': True}):
+            pass
+
+    def _request(self, request):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.socket_path)
+        try:
+            stream = sock.makefile('rwb')
+            stream.write(json.dumps(request) + '\n')
+            stream.flush()
+            for line in stream:
+                data = json.loads(line)
+                if data.has_key('error'):
+                    raise ServerError(data['error'])
+                yield data
+                if data.get('done'):
+                    return
+            raise ServerError('Connection closed by server.')
+        finally:
+            sock.close()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""Tests for the daemon module in nosetests style."""
+
+import os.path
+import socket
+import threading
+import time
+
+import checks as lc
+import daemon as ld
+import test_utils as lt
+import whitespace as lw
+
+
+def _connect(client, files, include_dirs):
+    """Return the violations of client.check(), once the server listens."""
+    for i in range(100):
+        try:
+            return set(client.check(files, include_dirs))
+        except socket.error:
+            time.sleep(0.05)
+    return set(client.check(files, include_dirs))
+
+
+def test_client_gets_violations_of_direct_run():
+    with lt.temporaryTree({'src/a.cpp': '#include "a.h"\nint x; \n',
+                           'src/a.h': 'namespace foo {\n}  // namespace bar\n'}) as root:
+        import main as lm
+        socket_path = os.path.join(root, 'linty.sock')
+        files = [os.path.join(root, 'src', 'a.cpp')]
+        include_dirs = [os.path.join(root, 'src')]
+        server = ld.LintServer(socket_path, [lw.WhitespaceCheck()],
+                               [lc.NoTrailingWhitespaceCheck()])
+        thread = threading.Thread(target=server.serve)
+        thread.daemon = True
+        thread.start()
+        client = ld.LintClient(socket_path)
+        try:
+            served = _connect(client, files, include_dirs)
+        finally:
+            client.shutdown()
+            thread.join()
+        options = ld.RequestOptions({'include_dirs': include_dirs})
+        checker = lm.Checker(options, [lw.WhitespaceCheck()], [lc.NoTrailingWhitespaceCheck()])
+        direct = checker.run(files)
+        assert sorted((v.rule_id, v.file, v.line) for v in served) == [
+            ('spacing.namespace', os.path.join(root, 'src', 'a.h'), 1),
+            ('whitespace.trailing', files[0], 2)]
+        assert served == direct
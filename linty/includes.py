@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+"""Include graph approximation and header ownership.
+
+The IncludeScanner reads the #include directives of files without running the
+preprocessor.  This is fast but only approximate: conditional inclusion and
+macro includes are not understood.  The HeaderOwnership builds upon this and
+assigns each in-scope header to exactly one translation unit that walks it.
+"""
+
+__author__ = 'Manuel Holtgrewe <manuel.holtgrewe@fu-berlin.de>'
+
+import logging
+import os
+import os.path
+import re
+
+RE_INCLUDE = re.compile(r'^[ \t]*#[ \t]*include[ \t]*([<"])([^>"\n]+)[>"]',
+                        re.MULTILINE)
+
+
+class IncludeScanner(object):
+    """Approximate the include graph from #include directives.
+
+    Includes are resolved relative to the including file (for quoted includes
+    only) and to the include directories.  Includes that cannot be resolved
+    (e.g. system headers) are ignored.  Resolved paths are normalized absolute
+    paths.
+    """
+
+    def __init__(self, include_dirs, file_reader=None):
+        self.include_dirs = [os.path.abspath(x) for x in include_dirs]
+        self.file_reader = file_reader
+        self._includes = {}
+        self._unresolved = {}
+        self._closures = {}
+
+    def inScope(self, path):
+        """Return True if path is below one of the include directories."""
+        path = os.path.abspath(path)
+        for x in self.include_dirs:
+            if path.startswith(x):
+                return True
+        return False
+
+    def includes(self, path):
+        """Return list of resolved files directly included by path."""
+        path = os.path.abspath(path)
+        if not self._includes.has_key(path):
+            result, unresolved = [], []
+            for quote, spelling in RE_INCLUDE.findall(self._read(path)):
+                resolved = self._resolve(path, quote, spelling)
+                if resolved:
+                    result.append(resolved)
+                else:
+                    unresolved.append(spelling)
+            self._includes[path] = result
+            self._unresolved[path] = unresolved
+        return self._includes[path]
+
+    def unresolvedIncludes(self, path):
+        """Return list of the spellings of includes of path not resolved."""
+        self.includes(path)
+        return self._unresolved[os.path.abspath(path)]
+
+    def closure(self, path):
+        """Return set of files transitively included by path, without path."""
+        path = os.path.abspath(path)
+        if not self._closures.has_key(path):
+            result = set()
+            stack = [path]
+            while stack:
+                for x in self.includes(stack.pop()):
+                    if x not in result and x != path:
+                        result.add(x)
+                        stack.append(x)
+            self._closures[path] = result
+        return self._closures[path]
+
+    def inScopeClosure(self, path):
+        """Return set of in-scope files transitively included by path."""
+        return set(x for x in self.closure(path) if self.inScope(x))
+
+    def leadingIncludes(self, path):
+        """Return the block of #include directives at the start of path.
+
+        Returns a list of (quote, spelling, resolved) triples where resolved
+        is None for includes that cannot be resolved.  Blank lines and
+        comments are skipped, the block ends at the first other line.
+        """
+        path = os.path.abspath(path)
+        result = []
+        in_comment = False
+        for line in self._read(path).splitlines():
+            line = line.strip()
+            if in_comment:
+                in_comment = '*/' not in line
+                continue
+            if not line or line.startswith('//'):
+                continue
+            if line.startswith('/*'):
+                in_comment = '*/' not in line[2:]
+                continue
+            match = RE_INCLUDE.match(line)
+            if not match:
+                break
+            quote, spelling = match.groups()
+            result.append((quote, spelling, self._resolve(path, quote, spelling)))
+        return result
+
+    def _resolve(self, path, quote, spelling):
+        candidates = self.include_dirs
+        if quote == '"':
+            candidates = [os.path.dirname(path)] + candidates
+        for d in candidates:
+            candidate = os.path.abspath(os.path.join(d, spelling))
+            if os.path.isfile(candidate):
+                return candidate
+        logging.debug('Could not resolve include %s in %s.', spelling, path)
+        return None
+
+    def _read(self, path):
+        try:
+            if self.file_reader:
+                return self.file_reader.readFile(path)[1]
+            with open(path, 'rb') as f:
+                return f.read()
+        except IOError, e:
+            logging.debug('Could not read %s: %s', path, e)
+            return ''
+
+
+class HeaderStubs(object):
+    """Empty stand-ins for the headers that cannot be resolved in scope.
+
+    For a shallow parse, the system and library headers included by the
+    checked files are replaced by stubs in directory which is searched before
+    all other include directories, also the ones of dependencies.  libclang's
+    error recovery keeps the AST of the checked files usable.  The stubs are
+    system headers, so they are never checked.
+    """
+
+    STUB = ('#pragma GCC system_header\n'
+            '// Empty stand-in for a header, written by linty.\n'
+            '#ifdef __cplusplus\n'
+            'namespace std {}\n'
+            '#endif\n')
+
+    def __init__(self, directory, scanner):
+        self.directory = os.path.abspath(directory)
+        self.scanner = scanner
+
+    def write(self, files):
+        """Write stubs for the unresolved includes of files and their closures."""
+        spellings = set()
+        for path in files:
+            for x in [path] + sorted(self.scanner.closure(path)):
+                spellings.update(self.scanner.unresolvedIncludes(x))
+        for spelling in sorted(spellings):
+            if os.path.isabs(spelling) or '..' in spelling.split('/'):
+                continue  # Would leave the stub directory.
+            path = os.path.join(self.directory, spelling)
+            if self._isStub(path):
+                continue
+            logging.debug('Writing stub for %s.', spelling)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as f:
+                f.write(self.STUB)
+
+    def _isStub(self, path):
+        """Return True if path is a stub of this version."""
+        try:
+            with open(path, 'rb') as f:
+                return f.read() == self.STUB
+        except IOError:
+            return False
+
+    def args(self):
+        """Return the clang arguments for parsing with the stubs.
+
+        They go before all other arguments, the -I directories are searched
+        in order and before the -isystem ones.
+        """
+        # Do not stop at the errors caused by missing declarations.
+        return ['-I%s' % self.directory, '-ferror-limit=0']
+
+
+class HeaderOwnership(object):
+    """Assign each in-scope header to exactly one translation unit.
+
+    The header is owned by the cheapest translation unit that includes it,
+    ties are broken by the order of the translation units.  All other
+    translation units block the header when walking.  The assignment is done
+    before walking starts, so it does not depend on the order in which the
+    translation units are processed.
+
+    Since the include graph is only approximated, an owner might not actually
+    include a header.  Such orphans are reassigned after the walk with
+    reassignOrphans().
+
+    For a shard, the ownership is computed over all translation units and
+    then restricted to the ones of the shard with restrict().
+    """
+
+    def __init__(self, scanner, files, cost=None):
+        if cost is None:
+            cost = lambda path: (len(scanner.closure(path)), fileSize(path))
+        self.scanner = scanner
+        self.files = [os.path.abspath(x) for x in files]
+        self.owner = {}
+        self.candidates = {}
+        costs = {}
+        for i, path in enumerate(self.files):
+            costs[path] = (cost(path), i)
+            self.owner[path] = path  # Main files are owned by themselves.
+        for path in self.files:
+            for header in scanner.inScopeClosure(path):
+                self.candidates.setdefault(header, []).append(path)
+        for header, candidates in self.candidates.items():
+            candidates.sort(key=lambda x: costs[x])
+            self.owner.setdefault(header, candidates[0])
+
+    def restrict(self, files):
+        """Let the translation units files own all headers they may include.
+
+        Headers owned by other translation units, e.g. of other shards, are
+        assigned to the cheapest candidate in files, in the order of the whole
+        file list.  Each shard then walks every header that its translation
+        units include, even if the owner in another shard does not include it
+        after all.  Headers walked by multiple shards give the same violations,
+        merging removes the duplicates.
+        """
+        files = set(os.path.abspath(x) for x in files)
+        for header, candidates in self.candidates.items():
+            if self.owner[header] in files:
+                continue
+            for path in candidates:
+                if path in files:
+                    self.owner[header] = path
+                    break
+
+    def blockedFiles(self, path):
+        """Return the in-scope files that path must not walk."""
+        path = os.path.abspath(path)
+        return set(x for x in self.scanner.inScopeClosure(path)
+                   if self.owner.get(x, path) != path)
+
+    def reassignOrphans(self, seen_by_unit):
+        """Reassign headers whose owner did not see them.
+
+        seen_by_unit maps each translation unit to the set of files seen when
+        walking it.  Only headers owned by these translation units are
+        considered, e.g. the ones of the current shard.  Returns a dict that
+        maps translation units to the set of orphaned headers they now own and
+        have to walk additionally.
+        """
+        seen = {}
+        for path, seen_files in seen_by_unit.items():
+            seen[os.path.abspath(path)] = set(os.path.abspath(x) for x in seen_files)
+        result = {}
+        for header, candidates in sorted(self.candidates.items()):
+            owner = self.owner[header]
+            if owner not in seen or header in seen[owner]:
+                continue
+            for path in candidates:
+                if header in seen.get(path, ()):
+                    logging.debug('Reassigning orphan %s from %s to %s.',
+                                  header, owner, path)
+                    self.owner[header] = path
+                    result.setdefault(path, set()).add(header)
+                    break
+        return result
+
+
+def fileSize(path):
+    """Return size of the file at path, 0 if it does not exist."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
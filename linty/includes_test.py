@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""Tests for the includes module in nosetests style."""
+
+import os
+import os.path
+
+import includes as lincl
+import test_utils as lt
+
+
+TREE = {
+    'include/a.h': '#include "b.h"\n#include <vector>\n',
+    'include/b.h': '\n',
+    'src/small.cpp': '#include <a.h>\nint x;\n',
+    'src/large.cpp': '#include <a.h>\n#include <b.h>\nint a_much_longer_name;\n',
+    }
+
+
+def test_include_scanner_closure():
+    with lt.temporaryTree(TREE) as root:
+        scanner = lincl.IncludeScanner([os.path.join(root, 'include')])
+        closure = scanner.closure(os.path.join(root, 'src', 'large.cpp'))
+        assert closure == set([os.path.join(root, 'include', 'a.h'),
+                               os.path.join(root, 'include', 'b.h')])
+
+
+def test_include_scanner_leading_includes():
+    with lt.temporaryTree({
+            'include/a.h': '\n',
+            'src/main.cpp': ('// License.\n/* More\n   license. */\n\n#include <a.h>\n'
+                             '#include <vector>\nint x;\n#include <b.h>\n'),
+            }) as root:
+        scanner = lincl.IncludeScanner([os.path.join(root, 'include')])
+        includes = scanner.leadingIncludes(os.path.join(root, 'src', 'main.cpp'))
+        assert includes == [('<', 'a.h', os.path.join(root, 'include', 'a.h')),
+                            ('<', 'vector', None)]
+
+
+def test_header_ownership_cheapest_unit():
+    with lt.temporaryTree(TREE) as root:
+        scanner = lincl.IncludeScanner([os.path.join(root, 'include')])
+        small = os.path.join(root, 'src', 'small.cpp')
+        large = os.path.join(root, 'src', 'large.cpp')
+        ownership = lincl.HeaderOwnership(scanner, [large, small])
+        assert ownership.owner[os.path.join(root, 'include', 'a.h')] == small
+        assert ownership.owner[os.path.join(root, 'include', 'b.h')] == small
+        assert ownership.blockedFiles(small) == set()
+        assert len(ownership.blockedFiles(large)) == 2
+
+
+def test_header_ownership_reassign_orphans():
+    with lt.temporaryTree(TREE) as root:
+        scanner = lincl.IncludeScanner([os.path.join(root, 'include')])
+        small = os.path.join(root, 'src', 'small.cpp')
+        large = os.path.join(root, 'src', 'large.cpp')
+        b_h = os.path.join(root, 'include', 'b.h')
+        ownership = lincl.HeaderOwnership(scanner, [large, small])
+        # small.cpp did not see b.h after all, large.cpp did.
+        orphans = ownership.reassignOrphans({small: set([small]),
+                                             large: set([large, b_h])})
+        assert orphans == {large: set([b_h])}
+        assert ownership.owner[b_h] == large
+
+
+def _walkedFiles(ownership, seen_by_unit):
+    """Return the files walked for seen_by_unit, including reassigned orphans."""
+    walked = set()
+    for path, seen_files in seen_by_unit.items():
+        walked |= seen_files - ownership.blockedFiles(path)
+    for path, orphans in ownership.reassignOrphans(seen_by_unit).items():
+        walked |= orphans
+    return walked
+
+
+def test_header_ownership_shards_walk_like_one_run():
+    with lt.temporaryTree(TREE) as root:
+        scanner = lincl.IncludeScanner([os.path.join(root, 'include')])
+        small = os.path.join(root, 'src', 'small.cpp')
+        large = os.path.join(root, 'src', 'large.cpp')
+        a_h = os.path.join(root, 'include', 'a.h')
+        b_h = os.path.join(root, 'include', 'b.h')
+        # small.cpp owns b.h but does not include it after all, only large.cpp.
+        seen_by_unit = {small: set([small, a_h]), large: set([large, a_h, b_h])}
+        one_run = _walkedFiles(lincl.HeaderOwnership(scanner, [large, small]), seen_by_unit)
+        assert one_run == set([small, large, a_h, b_h])
+        merged = set()
+        for shard in [[large], [small]]:
+            ownership = lincl.HeaderOwnership(scanner, [large, small])
+            ownership.restrict(shard)
+            merged |= _walkedFiles(ownership, dict((x, seen_by_unit[x]) for x in shard))
+        assert merged == one_run
+
+
+def test_header_stubs_for_unresolved_includes():
+    with lt.temporaryTree(TREE) as root:
+        scanner = lincl.IncludeScanner([os.path.join(root, 'include')])
+        stubs = lincl.HeaderStubs(os.path.join(root, 'stubs'), scanner)
+        stubs.write([os.path.join(root, 'src', 'small.cpp')])
+        assert os.listdir(os.path.join(root, 'stubs')) == ['vector']
+        assert stubs.args()[0] == '-I%s' % os.path.join(root, 'stubs')
@@ -11,7 +11,7 @@ import sys
 import violations as lv
 import checks as lc
 
-import clang.cindex as ci
+ci = lc.LazyModule('clang.cindex')
 
 # ============================================================================
 # Global Indentation Related Code
@@ -104,28 +104,13 @@ class IndentSyntaxNodeHandler(object):
         return ts[0]
 
     def _getTokenSet(self):
-        """Return TokenSet for this node, cached in self._token_set."""
+        """Return TokenSet for this node, cached in self._token_set.
+
+        The tokens are a slice of the file's tokens in the token index.
+        """
         if self._token_set:
             return self._token_set
-        tu = self.node.translation_unit
-        # TODO(holtgrew): The following workaround is only necessary because of inconsistency in libclang.
-        # Get extent data, to be fixed below.
-        start_file = self.node.extent.start.file
-        start_line = self.node.extent.start.line
-        start_column = self.node.extent.start.column
-        start = ci.SourceLocation.from_position(tu, start_file, start_line, start_column)
-        end_file = self.node.extent.end.file
-        end_line = self.node.extent.end.line
-        end_column = self.node.extent.end.column
-        # Fix extent.
-        npath, contents, lines = self.indentation_check.file_reader.readFile(start_file.name)
-        line = lines[self.node.extent.end.line - 1]
-        end_column = min(end_column, len(line.rstrip()))
-        # Build SourceRange.
-        end = ci.SourceLocation.from_position(tu, end_file, end_line, end_column)
-        extent = ci.SourceRange.from_locations(start, end)
-        # End of fixing extent.
-        self._token_set = ci.tokenize(tu, extent)
+        self._token_set = self.indentation_check.token_index.tokens(self.node.extent)
         return self._token_set
 
     # ------------------------------------------------------------------------
@@ -330,37 +315,44 @@ class CurlyBraceBlockHandler(IndentSyntaxNodeHandler):
                 msg = 'Closing brace should be on the same column as opening brace.'
                 self.logViolation('indent.brace', rbrace, msg)
 
-    def getTokenLeftOfLeftLCurlyBrace(self):
-        """Return the token left of the first opening curly brace or None."""
-        tk = ci.TokenKind
+    def _getCurlyBraceIndices(self):
+        """Return the indices (lbrace, rbrace) of the block braces in the token set.
+
+        The block is the one closed by the last closing curly brace, its
+        opening brace is found in the file's bracket index.  This skips
+        braces before the block, e.g. of brace initializers of constructors.
+        Falls back to the first opening curly brace if the last closing one
+        is unmatched within the node, e.g. because of macros.  The indices are
+        -1 if there are no such braces.
+        """
         token_set = self._getTokenSet()
-        res = None
-        for t in token_set:
-            if t.kind == tk.PUNCTUATION and t.spelling == '{':
-                return res
-            res = t
-        return None
+        j = token_set.rfind('}', ci.TokenKind.PUNCTUATION)
+        if j != -1:
+            i = token_set.matching(j)
+            if i is not None and 0 <= i < j:
+                return i, j
+        return token_set.find('{', ci.TokenKind.PUNCTUATION), j
+
+    def getTokenLeftOfLeftLCurlyBrace(self):
+        """Return the token left of the opening curly brace of the block or None."""
+        i = self._getCurlyBraceIndices()[0]
+        if i <= 0:
+            return None
+        return self._getTokenSet()[i - 1]
 
     def getLCurlyBrace(self):
-        """"Return the first opening curly brace or None."""
-        tk = ci.TokenKind
-        token_set = self._getTokenSet()
-        for t in token_set:
-            if t.kind == tk.PUNCTUATION and t.spelling == '{':
-                return t
-        return None
+        """"Return the opening curly brace of the block or None."""
+        i = self._getCurlyBraceIndices()[0]
+        if i == -1:
+            return None
+        return self._getTokenSet()[i]
 
     def getRCurlyBrace(self):
-        """Return the last closing curly brace or None."""
-        tk = ci.TokenKind
-        token_set = self._getTokenSet()
-        ##for x in token_set:
-        ##    print x.spelling, ', ',
-        ##print
-        for t in reversed(token_set):
-            if t.kind == tk.PUNCTUATION and t.spelling == '}':
-                return t
-        return None
+        """Return the closing curly brace of the block or None."""
+        j = self._getCurlyBraceIndices()[1]
+        if j == -1:
+            return None
+        return self._getTokenSet()[j]
 
 
 # ============================================================================
@@ -754,24 +746,15 @@ class DoStmtHandler(CurlyBraceBlockHandler):
         if self.node.data[0] is None:
             self.node = ci.Cursor.from_location(self.node.translation_unit, self.node.location)
 
-        # Get tokens of do/while keywords first.
+        # Get tokens of do/while keywords first.  The "while" is looked up by
+        # its cursor in the file's token annotation.
         stmt_tokens = self._getTokenSet()
-        stmt_tokens.annotate()
-        ##print [(x.spelling, x.kind) for x in stmt_tokens]
-        ##import pdb;  pdb.set_trace()
         assert stmt_tokens[0].spelling == 'do', 'First token must be do token.'
         do_token = stmt_tokens[0]
-        while_token = None
-        ##print >>sys.stderr, 'self.node', '\t', '\t', '\t\t\t\t\t\t', '\t', self.node.kind, '\t', self.node.spelling, '\t', self.node.location, '\t', self.node == self.node
-        ##print >>sys.stderr, '    data\t', self.node.data[0], '\t', self.node.data[1], '\t', self.node.data[2], '\txdata\t', self.node.xdata
-        for i, t in enumerate(stmt_tokens):
-            ##print >>sys.stderr, 'i==%d' % i, '\t', t.spelling, '\t', t.location, '\t', stmt_tokens.get_cursor(i).kind, '\t', stmt_tokens.get_cursor(i).spelling, '\t', stmt_tokens.get_cursor(i).location, '\t', stmt_tokens.get_cursor(i) == self.node
-            c = stmt_tokens.get_cursor(i)
-            ##print >>sys.stderr, '    data\t', c.data[0], '\t', c.data[1], '\t', c.data[2], '\txdata\t', c.xdata
-            if t.spelling == 'while' and stmt_tokens.get_cursor(i) == self.node:
-                while_token = t
-                break
-        assert while_token is not None, 'Must find while token.'
+        table = stmt_tokens.table
+        i = table.keywordOf(self.node, 'while')
+        assert i != -1, 'Must find while token.'
+        while_token = table.tokens[i]
         # Then, decide whether we have a compound statement as the first child.
         ck = ci.CursorKind
         children = [x for x in self.node.get_children()]
@@ -845,26 +828,7 @@ class DoStmtHandler(CurlyBraceBlockHandler):
 
     def _getTokenSetForNode(self, node):
         """Return TokenSet for node, no caching."""
-        tu = node.translation_unit
-        # TODO(holtgrew): The following workaround is only necessary because of inconsistency in libclang.
-        # Get extent data, to be fixed below.
-        start_file = node.extent.start.file
-        start_line = node.extent.start.line
-        start_column = node.extent.start.column
-        start = ci.SourceLocation.from_position(tu, start_file, start_line, start_column)
-        end_file = node.extent.end.file
-        end_line = node.extent.end.line
-        end_column = node.extent.end.column
-        # Fix extent.
-        npath, contents, lines = self.indentation_check.file_reader.readFile(start_file.name)
-        line = lines[node.extent.end.line - 1]
-        end_column = min(end_column, len(line.rstrip()))
-        end_column = max(0, end_column - 1)
-        # Build SourceRange.
-        end = ci.SourceLocation.from_position(tu, end_file, end_line, end_column)
-        extent = ci.SourceRange.from_locations(start, end)
-        # End of fixing extent.
-        return ci.tokenize(tu, extent)
+        return self.indentation_check.token_index.tokens(node.extent)
 
     def additionalIndentLevels(self):
         i1 = int(self.config.brace_positions_blocks == 'next-line-indent')
@@ -1922,6 +1886,8 @@ class IndentationConfig(object):
 class IndentationCheck(lc.TreeCheck):
     """Check for code and brace indentation."""
 
+    RUNTIME_ATTRIBUTES = lc.TreeCheck.RUNTIME_ATTRIBUTES + ('handlers', 'stopped_at', 'level')
+
     def __init__(self, config=IndentationConfig()):
         super(IndentationCheck, self).__init__()
         self.config = config
@@ -1575,6 +1575,25 @@ class MyClass {
     assert len(violations) == 0
 
 
+def test_constructor_brace_position_next_line_brace_initializer_correct():
+    # The braces of the initializer are not the braces of the body.
+    cpp_str = """
+class MyClass {
+    MyClass() : x{1}
+    {
+    }
+
+    int x;
+};
+"""
+    check = li.IndentationCheck(config=li.IndentationConfig(
+            brace_positions_function_declaration='next-line'
+        ))
+    violations = lt.checkTUStr(cpp_str, ast_check=check)
+    # Check resulting violation.
+    assert len(violations) == 0
+
+
 def test_constructor_brace_position_next_line_incorrect_first_brace_sameline():
     cpp_str = """
 class MyClass {
@@ -3,12 +3,26 @@
 
 __author__ = 'Manuel Holtgrewe <manuel.holtgrewe@fu-berlin.de>'
 
+import hashlib
 import logging
 import os
 import os.path
+import threading
+import time
 
 import clang.cindex as ci
 
+import cache as lc
+import checks as lchk
+import compdb as lcdb
+import includes as lincl
+import parallel as lp
+import pch as lpch
+import pipeline as lpl
+import schedule as ls
+import text as ltx
+import tokens as ltok
+import units as lu
 import violations as lv
 
 
@@ -42,27 +56,8 @@ class FilterSet(object):
         return True
 
 
-class CachingFileReader(object):
-    """Provide cached access to files."""
-
-    def __init__(self):
-        self._cache = {}
-
-    def readFile(self, path):
-        """Reads file at path and returns (npath, contents, lines).
-
-        npath is the normalized absolute path to path.  This method provides
-        cached access to files.  It normalizes the path name to keep duplicates
-        low.  The lines do not contain line breaks, contents is the verbatim
-        file content.
-        """
-        path = os.path.abspath(path)
-        if not self._cache.has_key(path):
-            with open(path, 'rb') as f:
-                fcontents = f.read()
-                flines = [x for x in fcontents.splitlines()]
-            self._cache[path] = (path, fcontents, flines)
-        return self._cache[path]
+# Kept here for the code that reads files through main.
+CachingFileReader = ltx.CachingFileReader
 
 
 def _hasFileLocation(node):
@@ -88,12 +83,38 @@ def _hasFileLocation(node):
     return True
 
 
+def _unitySpelling(filename):
+    """Return filename from the translation unit of a unity batch as spelled
+    when parsing the files one by one.
+
+    The in-memory file of the batch is in the working directory, so clang
+    prefixes the relative names of the files it includes, and of their
+    includes, with "./".
+    """
+    if filename and filename.startswith('./'):
+        return filename[2:]
+    return filename
+
+
+def _unityViolation(v):
+    """Return violation v of a unity batch walk with its file as in _unitySpelling()."""
+    return lv.RuleViolation(v.rule_id, _unitySpelling(v.file), v.line, v.column, v.msg)
+
+
 class VisitAllowedFilter(object):
-    """A lot of things are combined here, maybe split out into multiple classes?"""
-    def __init__(self, include_dirs):
+    """A lot of things are combined here, maybe split out into multiple classes?
+
+    Files in blocked_files are never visited.  If only_files is given then only
+    files in this set are visited.  System headers reported with
+    blockSystemHeader() are never visited, even below the include_dirs.
+    """
+    def __init__(self, include_dirs, blocked_files=(), only_files=None):
         self.include_dirs = [os.path.abspath(x) for x in include_dirs]
         self.cache = {}
-        self.blocked_files = set()
+        self.blocked_files = set(os.path.abspath(x) for x in blocked_files)
+        self.only_files = None
+        if only_files is not None:
+            self.only_files = set(os.path.abspath(x) for x in only_files)
 
     def nodeAllowed(self, node):
         # Visit if translation unit.
@@ -111,19 +132,18 @@ class VisitAllowedFilter(object):
             logging.debug('fileAllowed(%s) ? hit cache -> %s',
                           filename, self.cache[filename])
             return self.cache[filename]
+        path = os.path.abspath(filename)
         # Check whether the file is blocked.
-        if filename in self.blocked_files:
-            # print 'Blocked', node.location.file.name
-            logging.debug('fileAllowed(%s) ? -> blocked',
-                          filename, self.cache[filename])
+        if path in self.blocked_files or \
+                (self.only_files is not None and path not in self.only_files):
+            logging.debug('fileAllowed(%s) ? -> blocked', filename)
             self.cache[filename] = False
             return False
         # Check whether node's location is below the include directories.  It is
         # only visited if this is the case.
-        filename = os.path.abspath(filename)
         result = False
         for x in self.include_dirs:
-            if filename.startswith(x):
+            if path.startswith(x):
                 # print filename, x
                 result = True
                 break
@@ -131,31 +151,92 @@ class VisitAllowedFilter(object):
         self.cache[filename] = result  # Save in cache.
         return result
 
+    def blockSystemHeader(self, filename):
+        """Never visit filename, a system header, e.g. from the dependency include dirs."""
+        logging.debug('fileAllowed(%s) ? -> system header', filename)
+        self.cache[filename] = False
+
     def seenToBlocked(self, seen_files):
         """Move seen files to blocked files."""
-        self.blocked_files |= seen_files
+        self.blocked_files |= set(os.path.abspath(x) for x in seen_files)
 
 
 class AstWalker(object):
-    def __init__(self, translation_unit, ast_checks, include_dirs):
+    """Walk the AST of a translation unit with the AST checks.
+
+    If the file_reader is given then it gets the contents of the visited files
+    from libclang, if supported, instead of reading them again.  System headers
+    are recognized by libclang, if supported, otherwise by being below one of
+    the system_dirs.  They are neither walked nor seen.
+    """
+
+    def __init__(self, translation_unit, ast_checks, include_dirs, visit_filter=None,
+                 file_seen=None, file_reader=None, system_dirs=()):
         self.translation_unit = translation_unit
         self.ast_checks = ast_checks
         self.include_dirs = include_dirs
-        self.filter = VisitAllowedFilter(include_dirs)
+        self.filter = visit_filter or VisitAllowedFilter(include_dirs)
+        self.file_seen = file_seen  # Called with each file when first seen.
+        self.file_reader = file_reader
         self.seen_files = set()
+        self.system_files = set()
+        self.system_dirs = [os.path.abspath(x) for x in system_dirs]
+        self._main_file_allowed = None
 
     def run(self):
-        for check in self.ast_checks:
-            check.beginTree(self.translation_unit.cursor)
-        self._recurse(self.translation_unit.cursor)
-        for check in self.ast_checks:
-            check.endTree(self.translation_unit.cursor)
-        self.filter.seenToBlocked(self.seen_files)
+        # Nodes of the main file are recognized without looking up their file
+        # name if libclang supports clang_Location_isFromMainFile.
+        main_file = self.translation_unit.spelling
+        self._main_file_allowed = self.filter.fileAllowed(main_file)
+        self._fileSeen(main_file, ci.File.from_name(self.translation_unit, main_file))
+        # The checks share the tokens of the files, tokenized once.
+        token_index = ltok.TokenIndex(self.translation_unit, self.file_reader)
+        try:
+            for check in self.ast_checks:
+                check.setTokenIndex(token_index)
+                check.beginTree(self.translation_unit.cursor)
+            self._recurse(self.translation_unit.cursor)
+            for check in self.ast_checks:
+                check.endTree(self.translation_unit.cursor)
+        finally:
+            # The tables keep the translation unit alive.
+            for check in self.ast_checks:
+                check.setTokenIndex(None)
+
+    def _fileSeen(self, filename, file_obj, location=None):
+        """Record filename as seen, location is the first one seen in the file.
+
+        System headers are recognized once per file, from location.
+        """
+        if location is not None and self._isSystemHeader(filename, location):
+            self.system_files.add(filename)
+            self.filter.blockSystemHeader(filename)
+            return  # Not checked at all, also not by the text checks.
+        self.seen_files.add(filename)
+        if (self.file_reader and ci.has_capability('clang_getFileContents') and
+            not self.file_reader.isCached(filename) and self.filter.fileAllowed(filename)):
+            contents = self.translation_unit.get_file_contents(file_obj)
+            if contents is not None:
+                self.file_reader.addParsedContents(filename, contents)
+        if self.file_seen:
+            self.file_seen(filename)
+
+    def _isSystemHeader(self, filename, location):
+        if ci.has_capability('clang_Location_isInSystemHeader'):
+            return location.is_in_system_header
+        path = os.path.abspath(filename)
+        return any(path.startswith(x) for x in self.system_dirs)
 
     def _recurse(self, node):
-        if _hasFileLocation(node):
-            self.seen_files.add(node.location.file.name)
-        if not self.filter.nodeAllowed(node):
+        if node.location.is_from_main_file:
+            allowed = self._main_file_allowed
+        else:
+            if _hasFileLocation(node):
+                filename = node.location.file.name
+                if filename not in self.seen_files and filename not in self.system_files:
+                    self._fileSeen(filename, node.location.file, node.location)
+            allowed = self.filter.nodeAllowed(node)
+        if not allowed:
             logging.debug('AstWalker: Not allowed: %s', node)
             return False  # We did not visit this node.
         logging.debug('AstWalker: Candidate %s', node)
@@ -169,75 +250,501 @@ class AstWalker(object):
 
 
 class Checker(object):
-    def __init__(self, options, ast_checks, file_checks):
+    # Files up to this size are merged into unity batches.
+    UNITY_MAX_BYTES = 16 * 1024
+
+    def __init__(self, options, ast_checks, file_checks, provider=None):
         self.options = options
+        self.provider = provider
+        if provider is None:
+            self.provider = lu.TranslationUnitProvider(
+                getattr(options, 'units_per_index', 64),
+                getattr(options, 'megabytes_per_index', 1024))
+            if getattr(options, 'ast_cache', False):
+                self.provider = lu.SerializedAstProvider(self._cacheDir(), self._cacheBytes(),
+                                                         self.provider)
         self.ast_checks = ast_checks
         self.file_checks = file_checks
         self.listeners = []
         self.filters = FilterSet()
         self.file_reader = CachingFileReader()
         self.seen_files = set()
+        self.ownership = None
+        self.timings = {}
+        self.text_stage = None
+        self._compile_args = None
+        self.compilation_database = None
+        if getattr(options, 'compile_commands', None):
+            self.compilation_database = lcdb.CompilationDatabase(options.compile_commands)
+        self.stubs = None
+        self.pch = None
+        self.pch_files = {}  # filename -> precompiled header
+        self._pch_lock = threading.Lock()  # The prefetch thread also parses.
+        self._provider_lock = threading.Lock()  # libclang's Index is not thread-safe.
+        self.text_checker = ltx.TextChecker(options, file_checks, self.file_reader)
+        self.ast_cache = None
+        if getattr(options, 'cache_dir', None):
+            self.ast_cache = lc.AstResultCache(self._cacheDir(), ast_checks,
+                                               self._cacheBytes(), ci.get_version())
 
     def process(self, files):
         """Process all given files and return the error count."""
+        vs = self.run(files)
+        return lv.reportViolations(vs, self.file_reader, self.options,
+                                   getattr(self.options, 'result_file', None),
+                                   shard=getattr(self.options, 'shard', None))
+
+    def run(self, files):
+        """Process all given files and return the set of violations."""
         # Startup.
         #print 'Processing files %s' % files
         self._fireAuditStarted()
-        for check in self.ast_checks + self.file_checks:
-            check.setFileReader(self.file_reader)
-            check.beginProcessing()
+        lchk.beginProcessing(self.ast_checks + self.file_checks, self.file_reader)
         messages = set()
 
-        # Process all given files.
-        for filename in files:
-            # Perform AST walking based checks.
-            self._processAstWalk(filename)
-
-        # Run simpler ("text only") checks on all seen files.
-        filter_for_simple = VisitAllowedFilter(self.options.include_dirs)
-        for filename in self.seen_files:
-            if not filter_for_simple.fileAllowed(filename):
-                logging.debug('No check for %s', filename)
-                continue
-            logging.debug('Simple checks on %s', filename)
-            self._processSimpleChecks(filename)
+        # Select the files of our shard, if any.  Expensive translation units
+        # are started first, based on the history of earlier runs.  Each
+        # in-scope header is walked by only one translation unit of the shard,
+        # the ownership is resolved over all files before sharding.  Headers
+        # that their owner did not include after all are walked in a second
+        # round by another translation unit.
+        history = ls.CostHistory(self._historyPath())
+        shard = getattr(self.options, 'shard', None)
+        scanner = lincl.IncludeScanner(self.options.include_dirs, self.file_reader)
+        if len(files) > 1 or shard:
+            scheduler = ls.Scheduler(history, scanner)
+            self.ownership = lincl.HeaderOwnership(scanner, files, scheduler.staticEstimate)
+            if shard:
+                weight = getattr(self.options, 'shard_weight', 'size')
+                files = scheduler.shard(files, shard[0], shard[1], weight)
+                self.ownership.restrict(files)
+            files = scheduler.order(files)
+            if self.compilation_database and self._jobs() == 1:
+                # Translation units with the same flags are parsed one after
+                # another, starting with the group of the most expensive one.
+                # This only orders the serial run, work is shared within a
+                # group only through the precompiled headers of --pch.
+                files = sum(self.compilation_database.groups(files), [])
+        if getattr(self.options, 'shallow', False):
+            # Headers that are not checked are replaced by empty stubs.
+            self.stubs = lincl.HeaderStubs(os.path.join(self._cacheDir(), 'stubs'), scanner)
+            self.stubs.write(files)
+        if getattr(self.options, 'pch', False) and not self.file_reader.unsaved_files:
+            # Translation units with the same leading includes share a
+            # precompiled header.
+            self.pch = lpch.PrecompiledHeaders(os.path.join(self._cacheDir(), 'pch'), scanner)
+            self.pch_files = self.pch.assign(files, self._parseArgs, self.provider.index())
+        # The text checks run on each in-scope file as soon as it is seen, in
+        # a thread unless we already use worker processes for the AST walks.
+        filter_for_simple = self._visitFilter()
+        self.text_stage = lpl.TextCheckStage(self._processSimpleChecks,
+                                             filter_for_simple.fileAllowed,
+                                             threaded=(self._jobs() == 1))
+        units = files
+        if getattr(self.options, 'unity', 0) > 1 and not self.file_reader.unsaved_files:
+            units = self._unityBatches(files, self.options.unity)
+        try:
+            seen_by_unit = self._processAstWalks([(u, None) for u in units])
+            if self.ownership:
+                orphans = self.ownership.reassignOrphans(seen_by_unit)
+                self._processAstWalks(sorted(orphans.items()))
+        finally:
+            # Wait for the text checks.
+            self.text_stage.finish()
+            self.text_stage = None
+        for filename, (parse_time, walk_time) in self.timings.items():
+            history.record(filename, parse_time, walk_time)
+        history.save()
+        self.text_checker.save()
 
         # Shutdown.
         for check in self.ast_checks + self.file_checks:
             check.finishProcessing()
         self._fireAuditFinished()
 
-        # Print violations.
+        # Collect violations.
         vs = set()
         for check in self.ast_checks + self.file_checks:
             vs.update(check.violations)
-        logging.info('VIOLATIONS')
-        printer = lv.ViolationPrinter(self.file_reader, self.options.ignore_nolint, self.options.show_source, self.options.ignore_rules)
-        printer.show(vs)
-        return int(len(vs) > 0)
+        return vs
+
+    def _cacheDir(self):
+        return getattr(self.options, 'cache_dir', None) or '.linty_cache'
+
+    def _historyPath(self):
+        """Return the path of the runtime history, None to keep none."""
+        history = getattr(self.options, 'history', None)
+        if history is None and getattr(self.options, 'cache_dir', None):
+            return os.path.join(self.options.cache_dir, 'history.json')
+        return history
+
+    def _cacheBytes(self):
+        return getattr(self.options, 'cache_size', 256) * 1024 * 1024
+
+    def _jobs(self):
+        return getattr(self.options, 'jobs', 1)
+
+    def _processAstWalks(self, tasks):
+        """Walk the translation units for the (filename, only_files) tasks.
+
+        The filename can also be a tuple of files for a unity batch, see
+        _unityBatches().  Returns a dict that maps each filename to the files
+        seen in its walk, files of a batch map to the files seen in the batch.
+        """
+        seen_by_unit = {}
+        if self._useAstCache():
+            tasks = [(filename, only_files) for filename, only_files in tasks
+                     if isinstance(filename, tuple) or
+                     not self._applyCachedWalk(filename, only_files, seen_by_unit)]
+        if self._jobs() != 1 and len(tasks) > 1:
+            for filename, seen_files in lp.TranslationUnitPool(self, self._jobs()).run(tasks):
+                seen_by_unit[filename] = seen_files
+                for x in sorted(seen_files):
+                    self._fileSeen(x)
+        else:
+            # The next translation unit is parsed while walking this one.
+            parse = lambda task: self._parseUnit(task[0])
+            walks = lpl.prefetch(parse, tasks)
+            try:
+                for (filename, only_files), parsed in walks:
+                    seen_by_unit[filename] = self._walkUnit(filename, parsed, only_files)
+            finally:
+                walks.close()  # Stops parsing ahead if a walk failed.
+        for unit, seen_files in seen_by_unit.items():
+            if isinstance(unit, tuple):
+                del seen_by_unit[unit]
+                for filename in unit:
+                    seen_by_unit[filename] = seen_files
+        return seen_by_unit
+
+    def _useAstCache(self):
+        # Unsaved files are not tracked as dependencies.
+        return self.ast_cache and not self.file_reader.unsaved_files
+
+    def _astCacheKey(self, filename, only_files):
+        return self.ast_cache.key(filename, self._clangArgs(filename),
+                                  self._blockedFiles(filename, only_files), only_files)
+
+    def _applyCachedWalk(self, filename, only_files, seen_by_unit):
+        """Take the results of walking filename from the cache if up to date.
+
+        Returns True if the cached results were used.
+        """
+        cached = self.ast_cache.get(self._astCacheKey(filename, only_files))
+        if cached is None or len(cached[0]) != len(self.ast_checks):
+            return False
+        logging.info('Using cached results for %s.', filename)
+        violations, seen_files = cached
+        for check, vs in zip(self.ast_checks, violations):
+            check.violations.update(lv.violationFromList(l) for l in vs)
+        seen_by_unit[filename] = seen_files
+        self.seen_files |= seen_files
+        for x in sorted(seen_files):
+            self._fileSeen(x)
+        return True
+
+    def _processAstWalk(self, filename, only_files=None):
+        """Parse filename and walk its AST, return the set of seen files.
+
+        If only_files is given then only these files are walked, otherwise all
+        in-scope files not owned by other translation units.
+        """
+        return self._walkUnit(filename, self._parseUnit(filename), only_files)
+
+    def _parseUnit(self, unit):
+        """Parse a file or unity batch."""
+        if isinstance(unit, tuple):
+            return self._parseUnityBatch(unit)
+        return self._parse(unit)
+
+    def _walkUnit(self, unit, parsed, only_files=None):
+        """Walk a file or unity batch parsed by _parseUnit()."""
+        if isinstance(unit, tuple):
+            return self._walkUnityBatch(unit, parsed)
+        return self._walk(unit, parsed, only_files)
+
+    def _unityBatches(self, files, batch_size):
+        """Return files with small files merged into batches of batch_size.
+
+        Batches are tuples of files with the same clang arguments.  They are
+        parsed as one translation unit that includes all of them.
+        """
+        batches = {}
+        for filename in files:
+            if lincl.fileSize(filename) <= self.UNITY_MAX_BYTES:
+                batches.setdefault(tuple(self._clangArgs(filename)), [[]])
+                batch = batches[tuple(self._clangArgs(filename))]
+                if len(batch[-1]) == batch_size:
+                    batch.append([])
+                batch[-1].append(filename)
+        unit_of = {}
+        for batch in sum(batches.values(), []):
+            if len(batch) > 1:
+                for filename in batch:
+                    unit_of[filename] = tuple(batch)
+        units = []
+        for filename in files:
+            unit = unit_of.get(filename, filename)
+            if unit not in units:
+                units.append(unit)
+        return units
 
-    def _processAstWalk(self, filename):
-        # Create libclang index for AST access.
+    def _parseUnityBatch(self, batch):
+        """Parse the unity batch, return (translation unit, parse time).
+
+        The translation unit is None if merging the files failed.
+        """
+        path, contents = self._unityFile(batch)
+        logging.info('Building index for %s (%s).', path, ', '.join(batch))
+        start = time.time()
+        translation_unit = self._providerParse(path, self._clangArgs(batch[0]),
+                                               [(path, contents)])
+        if not translation_unit:
+            logging.warning('Could not parse unity batch %s.', path)
+        else:
+            # Errors in shallow parses are expected, the headers are missing.
+            severity = ci.Diagnostic.Error
+            if self.stubs:
+                severity = ci.Diagnostic.Fatal
+            for diagnostic in translation_unit.diagnostics:
+                if diagnostic.severity >= severity:
+                    logging.warning('Unity batch %s failed: %s', path, diagnostic.spelling)
+                    translation_unit = None
+                    break
+            if translation_unit and self.stubs:
+                self._warnDroppedCode(translation_unit, path)
+        return translation_unit, time.time() - start
+
+    def _walkUnityBatch(self, batch, parsed):
+        """Walk the parsed unity batch or, if it failed, each of its files."""
+        if not parsed[0]:
+            logging.warning('Falling back to parsing %s one by one.', ', '.join(batch))
+            seen_files = set()
+            for filename in batch:
+                seen_files |= self._walk(filename, self._parse(filename))
+            return seen_files
+        blocked_files = set()
+        if self.ownership:
+            members = set(os.path.abspath(x) for x in batch)
+            for filename in batch:
+                blocked_files |= set(x for x in self.ownership.blockedFiles(filename)
+                                     if self.ownership.owner.get(x) not in members)
+        return self._walk(self._unityFile(batch)[0], parsed, blocked_files=blocked_files,
+                          synthetic=True)
+
+    def _unityFile(self, batch):
+        """Return (path, contents) of the in-memory file for the unity batch.
+
+        The file includes the files of the batch, so locations and violations
+        refer to the original files and lines.  It is in the working directory
+        and includes the files as given, so they and their headers are spelled
+        like when parsing them one by one, see _unitySpelling().
+        """
+        paths = [os.path.abspath(x) for x in batch]
+        name = '.linty-unity-%s.cpp' % hashlib.sha1('\0'.join(paths)).hexdigest()
+        return name, ''.join('#include "%s"\n' % x for x in batch)
+
+    def setUnsavedFile(self, path, contents):
+        """Check contents instead of the file at path.
+
+        The contents are used by libclang as well as by the text checks, so
+        the file does not have to exist on disk.
+        """
+        self.file_reader.setContents(path, contents)
+
+    def _parse(self, filename):
+        """Parse filename, return (translation unit, parse time).
+
+        The translation unit is None if filename could not be parsed.
+        """
         logging.info('Building index for %s.', filename)
-        index = ci.Index.create()
-        args = ['-I%s' % s for s in self.options.include_dirs]
-        # TODO(holtgrew): Make C++11 support configurable.
-        args += ['--std=c++11']
-        translation_unit = index.parse(filename, args=args)
+        unsaved_files = self.file_reader.unsaved_files.items()
+        path = filename
+        if unsaved_files:
+            path = os.path.abspath(filename)  # Unsaved files are known by it.
+        start = time.time()
+        translation_unit = self._providerParse(path, self._clangArgs(filename),
+                                               unsaved_files)
+        with self._pch_lock:
+            pch_path = self.pch_files.get(filename)
+        if pch_path and (not translation_unit or
+                         lpch.hasPchErrors(translation_unit, pch_path)):
+            # E.g. a header was touched since the precompiled header was built.
+            self._discardPch(pch_path)
+            translation_unit = self._providerParse(path, self._clangArgs(filename),
+                                                   unsaved_files)
+        if not translation_unit:
+            logging.error('Could not parse %s.', filename)
+            return None, time.time() - start
         logging.info('Translation unit: %s', translation_unit.spelling)
+        if self.stubs:
+            self._warnDroppedCode(translation_unit, filename)
+        return translation_unit, time.time() - start
 
+    def _providerParse(self, filename, args, unsaved_files):
+        """Parse with the provider, one thread at a time.
+
+        The fallback of a failed unity batch parses while the prefetch thread
+        parses the next translation unit with the same Index.
+        """
+        with self._provider_lock:
+            return self.provider.parse(filename, args, unsaved_files, self._parseOptions())
+
+    def _discardPch(self, pch_path):
+        """Discard the precompiled header for all files of its group."""
+        with self._pch_lock:
+            files = [x for x, path in self.pch_files.items() if path == pch_path]
+            if not files:
+                return  # Already discarded.
+            for filename in files:
+                del self.pch_files[filename]
+            self.pch.discard(pch_path)
+
+    def _warnDroppedCode(self, translation_unit, filename):
+        """Log the errors of a shallow parse in the checked files.
+
+        libclang drops the declarations and statements that use names from the
+        stubbed headers, e.g. std::string, so the AST checks do not see them.
+        Return the number of these errors.
+        """
+        visit_filter = self._visitFilter()
+        errors = 0
+        for diagnostic in translation_unit.diagnostics:
+            location = diagnostic.location
+            if (diagnostic.severity >= ci.Diagnostic.Error and location.file and
+                    visit_filter.fileAllowed(location.file.name)):
+                logging.debug('Shallow parse error at %s:%d: %s', location.file.name,
+                              location.line, diagnostic.spelling)
+                errors += 1
+        if errors:
+            logging.warning('Shallow parse of %s has %d errors in checked files, code '
+                            'using the stubbed headers is not checked.', filename, errors)
+        return errors
+
+    def _parseOptions(self):
+        """Return the TranslationUnit.PARSE_* flags for the AST checks."""
+        if lchk.needsFunctionBodies(self.ast_checks):
+            return ci.TranslationUnit.PARSE_NONE
+        return ci.TranslationUnit.PARSE_SKIP_FUNCTION_BODIES
+
+    def _clangArgs(self, filename):
+        """Return the libclang arguments for parsing filename."""
+        args = self._parseArgs(filename)
+        with self._pch_lock:
+            pch_path = self.pch_files.get(filename)
+        if pch_path:
+            args += ['-include-pch', pch_path]
+        return args
+
+    def _parseArgs(self, filename):
+        """Return the arguments for filename, without precompiled header."""
+        args = self._compileArgs(filename)
+        if self.stubs:
+            # Also ahead of the dependencies and the include directories of
+            # the compilation database.
+            args = self.stubs.args() + args
+        return args
+
+    def _compileArgs(self, filename):
+        """Return the compiler arguments for filename, without libclang extras.
+
+        The arguments are taken from the compilation database if it has an
+        entry for filename.
+        """
+        if self.compilation_database:
+            args = self.compilation_database.args(filename)
+            if args is not None:
+                return args
+        if self._compile_args is None:
+            self._compile_args = ['-I%s' % s for s in self.options.include_dirs]
+            # Dependencies are not checked and clang treats them as system headers.
+            for s in getattr(self.options, 'dep_include_dirs', []):
+                self._compile_args += ['-isystem', s]
+            # TODO(holtgrew): Make C++11 support configurable.
+            self._compile_args += ['--std=c++11']
+        return list(self._compile_args)
+
+    def _walk(self, filename, parsed, only_files=None, blocked_files=None, synthetic=False):
+        """Walk the AST of a translation unit parsed by _parse().
+
+        blocked_files overrides the files blocked by the header ownership,
+        e.g. for unity batches.  Their results are not cached.  If synthetic
+        is True then filename is an in-memory file, e.g. of a unity batch,
+        that is neither walked nor seen.
+        """
+        translation_unit, parse_time = parsed
+        if not translation_unit:
+            return set()
         # Run AST walk based checks.
         logging.debug('AST Walk on %s, checks: %s', filename, self.ast_checks)
-        ast_walker = AstWalker(translation_unit, self.ast_checks, self.options.include_dirs)
-        ast_walker.run()
+        use_cache = self._useAstCache() and blocked_files is None
+        record_time = only_files is None and blocked_files is None
+        if blocked_files is None:
+            blocked_files = self._blockedFiles(filename, only_files)
+        file_seen = self._fileSeen
+        if synthetic:
+            blocked_files = set(blocked_files) | set([filename])
+            file_seen = lambda x: x != filename and self._fileSeen(_unitySpelling(x))
+        visit_filter = self._visitFilter(blocked_files, only_files)
+        ast_walker = AstWalker(translation_unit, self.ast_checks, self.options.include_dirs,
+                               visit_filter, file_seen, self.file_reader,
+                               self._systemDirs())
+        if use_cache or synthetic:
+            # Collect the violations of this walk separately for the cache.
+            previous = [check.violations for check in self.ast_checks]
+            for check in self.ast_checks:
+                check.violations = set()
+        start = time.time()
+        try:
+            ast_walker.run()
+        finally:
+            if use_cache or synthetic:
+                walk_violations = [check.violations for check in self.ast_checks]
+                if synthetic:
+                    walk_violations = [set(_unityViolation(v) for v in vs)
+                                       for vs in walk_violations]
+                for check, vs, walk_vs in zip(self.ast_checks, previous, walk_violations):
+                    check.violations = vs | walk_vs
+        if record_time:
+            self.timings[filename] = (parse_time, time.time() - start)
         logging.debug('AST Walk DONE on %s', filename)
+        if synthetic:
+            ast_walker.seen_files.discard(filename)
+            ast_walker.seen_files = set(_unitySpelling(x) for x in ast_walker.seen_files)
         self.seen_files |= ast_walker.seen_files
+        if use_cache:
+            dependencies = [translation_unit.spelling]
+            dependencies += [x.include.name for x in translation_unit.get_includes()]
+            violations = [[lv.violationToList(v) for v in sorted(vs)] for vs in walk_violations]
+            self.ast_cache.put(self._astCacheKey(filename, only_files), dependencies,
+                               violations, ast_walker.seen_files)
+        return ast_walker.seen_files
+
+    def _visitFilter(self, blocked_files=(), only_files=None):
+        """Return VisitAllowedFilter for the in-scope files."""
+        return VisitAllowedFilter(self.options.include_dirs, blocked_files, only_files)
+
+    def _systemDirs(self):
+        """Return the directories passed as -isystem, for libclang without
+        clang_Location_isInSystemHeader."""
+        system_dirs = list(getattr(self.options, 'dep_include_dirs', []))
+        if self.stubs:
+            system_dirs.append(self.stubs.directory)
+        return system_dirs
+
+    def _blockedFiles(self, filename, only_files):
+        """Return the files not to walk in the translation unit for filename."""
+        if self.ownership and only_files is None:
+            return self.ownership.blockedFiles(filename)
+        return ()
+
+    def _fileSeen(self, filename):
+        if self.text_stage:
+            self.text_stage.submit(filename)
 
     def _processSimpleChecks(self, filename):
         self._fireFileStarted(filename)
-        fpath, fcontent, flines = self.file_reader.readFile(filename)
-        for check in self.file_checks:
-            check.process(fpath, fcontent, flines)
+        self.text_checker.check(filename)
         self._fireFileFinished(filename)
 
     def _fireAuditStarted(self):
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+"""Tests for the main module in nosetests style."""
+
+import glob
+import json
+import logging
+import os.path
+
+import checks as lc
+import indent as li
+import main as lm
+import test_utils as lt
+import units as lu
+import whitespace as lw
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples')
+
+
+def _options(root, **kwargs):
+    """Return Checker options for the include directory root."""
+    options = lt.Data(include_dirs=[root], ignore_nolint=False, show_source=False,
+                      ignore_rules=[])
+    options.__dict__.update(kwargs)
+    return options
+
+
+def _lines(vs):
+    """Return sorted (file name, line) of the violations vs."""
+    return sorted((os.path.basename(v.file), v.line) for v in vs)
+
+
+def test_text_checks_skip_system_headers():
+    # The dependency is below the include directory.
+    with lt.temporaryTree({'a.cpp': '#include <d.h>\nint x; \n',
+                           'dep/d.h': 'int y; \n'}) as root:
+        options = _options(root, dep_include_dirs=[os.path.join(root, 'dep')])
+        checker = lm.Checker(options, [], [lc.NoTrailingWhitespaceCheck()])
+        assert _lines(checker.run([os.path.join(root, 'a.cpp')])) == [('a.cpp', 2)]
+
+
+def test_text_checks_skip_system_headers_in_parallel_and_cached_runs():
+    # libclang marks d.h as system header although it is in scope.
+    if not lm.ci.has_capability('clang_Location_isInSystemHeader'):
+        return
+    files = {'a.cpp': '#include "d.h"\nint x; \n', 'b.cpp': 'int z; \n',
+             'd.h': '#pragma GCC system_header\nint y; \n'}
+    with lt.temporaryTree(files) as root:
+        names = [os.path.join(root, 'a.cpp'), os.path.join(root, 'b.cpp')]
+        expected = [('a.cpp', 2), ('b.cpp', 1)]
+        cache_dir = os.path.join(root, 'cache')
+        # The second run with the cache dir takes the AST walks from the cache.
+        for kwargs in [dict(jobs=1), dict(jobs=2), dict(cache_dir=cache_dir),
+                       dict(cache_dir=cache_dir)]:
+            checker = lm.Checker(_options(root, **kwargs), [lw.WhitespaceCheck()],
+                                 [lc.NoTrailingWhitespaceCheck()])
+            assert _lines(checker.run(names)) == expected
+
+
+def _checkExamples(**kwargs):
+    """Return the violations of checking the examples with options kwargs."""
+    checker = lm.Checker(_options(EXAMPLES, **kwargs),
+                         [li.IndentationCheck(), lw.WhitespaceCheck()],
+                         [lc.NoTrailingWhitespaceCheck()])
+    return checker.run(sorted(glob.glob(os.path.join(EXAMPLES, '*.cpp'))))
+
+
+def test_parallel_run_equals_serial_run():
+    serial = _checkExamples(jobs=1)
+    assert _checkExamples(jobs=2) == serial
+
+
+class FailingCheck(lc.TreeCheck):
+    def enterNode(self, node):
+        raise ValueError('Failing check.')
+
+
+def test_parallel_run_raises_worker_errors():
+    checker = lm.Checker(_options(EXAMPLES, jobs=2), [FailingCheck()], [])
+    try:
+        checker.run(sorted(glob.glob(os.path.join(EXAMPLES, '*.cpp'))))
+        assert False, 'Expected ValueError.'
+    except ValueError, e:
+        assert str(e) == 'Failing check.'
+
+
+def _checkInDirectory(files, names, **kwargs):
+    """Return sorted (file, line, rule) of checking the relative paths names.
+
+    The files (dict path -> contents) are created in a temporary directory,
+    which is the working directory while checking.  The text checks report
+    absolute paths, they are made relative to the directory.
+    """
+    with lt.temporaryTree(files) as root:
+        cwd = os.getcwd()
+        os.chdir(root)
+        try:
+            checker = lm.Checker(_options('.', **kwargs), [lw.WhitespaceCheck()],
+                                 [lc.NoTrailingWhitespaceCheck()])
+            vs = checker.run(names)
+            root = os.getcwd()  # Resolved like the absolute paths.
+            return sorted((v.file.startswith('/') and os.path.relpath(v.file, root) or v.file,
+                           v.line, v.rule_id) for v in vs)
+        finally:
+            os.chdir(cwd)
+
+
+def test_unity_batch_reports_files_as_given():
+    files = {'src/a.cpp': 'namespace a {\n}  // namespace b\n', 'src/b.cpp': 'int y; \n'}
+    names = ['src/a.cpp', 'src/b.cpp']
+    expected = [('src/a.cpp', 1, 'spacing.namespace'), ('src/b.cpp', 1, 'whitespace.trailing')]
+    assert _checkInDirectory(files, names) == expected
+    assert _checkInDirectory(files, names, unity=2) == expected
+
+
+def test_unity_batch_falls_back_to_single_files():
+    # Both files define x, so the batch does not compile.
+    files = {'src/a.cpp': 'int x; \n', 'src/b.cpp': 'int x;\nnamespace b {\n}  // namespace c\n'}
+    names = ['src/a.cpp', 'src/b.cpp']
+    expected = [('src/a.cpp', 1, 'whitespace.trailing'), ('src/b.cpp', 2, 'spacing.namespace')]
+    assert _checkInDirectory(files, names) == expected
+    assert _checkInDirectory(files, names, unity=2) == expected
+
+
+def test_unity_batch_spells_shared_headers_like_single_files():
+    # c.cpp is too large for a batch, it is parsed on its own.
+    large = 'int c;\n' + '// Padding.\n' * 2000
+    files = {'src/a.cpp': '#include "h.h"\n', 'src/b.cpp': 'int b;\n',
+             'src/c.cpp': '#include "h.h"\n' + large,
+             'src/h.h': 'namespace h {\n}  // namespace i\nint g; \n'}
+    names = ['src/a.cpp', 'src/b.cpp', 'src/c.cpp']
+    expected = [('src/h.h', 1, 'spacing.namespace'), ('src/h.h', 3, 'whitespace.trailing')]
+    assert _checkInDirectory(files, names) == expected
+    assert _checkInDirectory(files, names, unity=2) == expected
+
+
+def test_compilation_database_entry_is_parsed_with_its_flags():
+    # The database entry is relative to the build directory.
+    entry = {'file': '../src/a.cpp',
+             'command': 'ccache c++ -DX -I../include -c ../src/a.cpp'}
+    files = {'src/a.cpp': ('#include "h.h"\n#ifdef X\nnamespace a {\n}  // namespace b\n'
+                           '#endif\n'),
+             'include/h.h': 'namespace h {\n}  // namespace i\n'}
+    with lt.temporaryTree(files) as root:
+        build = os.path.join(root, 'build')
+        os.mkdir(build)
+        with open(os.path.join(build, 'compile_commands.json'), 'wb') as f:
+            json.dump([dict(entry, directory=build)], f)
+        cwd = os.getcwd()
+        os.chdir(root)
+        try:
+            checker = lm.Checker(_options('.', compile_commands='build'),
+                                 [lw.WhitespaceCheck()], [])
+            vs = checker.run(['src/a.cpp'])
+        finally:
+            os.chdir(cwd)
+    assert _lines(vs) == [('a.cpp', 3), ('h.h', 1)]
+
+
+class _RecordingHandler(logging.Handler):
+    """Keep the messages of the logged records."""
+    def __init__(self):
+        logging.Handler.__init__(self, logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def test_shallow_parse_warns_about_dropped_code():
+    # The declaration of v uses the stubbed <vector>, it is dropped from the
+    # AST and only the text checks see its line.
+    files = {'src/a.cpp': ('#include <vector>\nstd::vector<int> v; \n'
+                           'namespace a {\n}  // namespace b\n')}
+    handler = _RecordingHandler()
+    logging.getLogger().addHandler(handler)
+    try:
+        vs = _checkInDirectory(files, ['src/a.cpp'], shallow=True, cache_dir='cache')
+    finally:
+        logging.getLogger().removeHandler(handler)
+    assert vs == [('src/a.cpp', 2, 'whitespace.trailing'), ('src/a.cpp', 3, 'spacing.namespace')]
+    assert [m for m in handler.messages if m.startswith('Shallow parse of src/a.cpp has ')]
+
+
+class _RejectingProvider(lu.TranslationUnitProvider):
+    """Fail to parse with precompiled headers, record the parses."""
+    def __init__(self):
+        super(_RejectingProvider, self).__init__()
+        self.pch_parses = []
+
+    def parse(self, filename, args, unsaved_files=(), options=0):
+        if '-include-pch' in args:
+            self.pch_parses.append(filename)
+        return None
+
+
+class _RecordingProvider(lu.TranslationUnitProvider):
+    """Record the parse options."""
+    def __init__(self):
+        super(_RecordingProvider, self).__init__()
+        self.options = []
+
+    def parse(self, filename, args, unsaved_files=(), options=0):
+        self.options.append(options)
+        return super(_RecordingProvider, self).parse(filename, args, unsaved_files, options)
+
+
+def test_function_bodies_are_skipped_without_indentation_check():
+    skip = lm.ci.TranslationUnit.PARSE_SKIP_FUNCTION_BODIES
+    with lt.temporaryTree({'a.cpp': 'int f() {\n  return 0;\n}\n'}) as root:
+        for ast_checks, expected in [([lw.WhitespaceCheck()], skip),
+                                     ([lw.WhitespaceCheck(), li.IndentationCheck()], 0)]:
+            provider = _RecordingProvider()
+            checker = lm.Checker(_options(root), ast_checks, [], provider)
+            checker.run([os.path.join(root, 'a.cpp')])
+            assert [x & skip for x in provider.options] == [expected]
+
+
+def test_rejected_pch_is_tried_once_per_group():
+    files = {'a.cpp': '#include "h.h"\nint a;\n', 'b.cpp': '#include "h.h"\nint b;\n',
+             'h.h': 'int h;\n'}
+    with lt.temporaryTree(files) as root:
+        provider = _RejectingProvider()
+        options = _options(root, pch=True, cache_dir=os.path.join(root, 'cache'))
+        checker = lm.Checker(options, [lw.WhitespaceCheck()], [], provider)
+        checker.run([os.path.join(root, 'a.cpp'), os.path.join(root, 'b.cpp')])
+        assert len(provider.pch_parses) == 1
+        assert checker.pch_files == {}
+
+
+def test_shallow_parse_stubs_dependency_headers():
+    # The namespace is only seen if the dependency header is parsed.
+    files = {'src/a.cpp': ('#include <d.h>\n#ifdef D_PARSED\n'
+                           'namespace a {\n}  // namespace b\n#endif\n'),
+             'dep/d.h': '#define D_PARSED\n'}
+    names = ['src/a.cpp']
+    expected = [('src/a.cpp', 3, 'spacing.namespace')]
+    assert _checkInDirectory(files, names, dep_include_dirs=['dep']) == expected
+    assert _checkInDirectory(files, names, dep_include_dirs=['dep'], shallow=True,
+                             cache_dir='cache') == []
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""Parallel processing of translation units in worker processes.
+
+Each worker process owns a copy of the Checker (and thus of all AST checks)
+that it inherits when the pool is forked.  The workers parse and walk one
+translation unit at a time and send the violations of each AST check back to
+the parent process which merges them into its own checks.
+"""
+
+__author__ = 'Manuel Holtgrewe <manuel.holtgrewe@fu-berlin.de>'
+
+import logging
+import multiprocessing
+
+# The Checker of the current worker process, set in _initWorker().
+_checker = None
+
+
+def _initWorker(checker):
+    """Initialize worker process with its own copy of checker."""
+    global _checker
+    _checker = checker
+    _checker.text_stage = None  # Text checks run in the parent process.
+
+
+def _walkTranslationUnit(task):
+    """Parse and walk the translation unit for the task in the worker.
+
+    The task is a pair (filename, only_files), see Checker._processAstWalk().
+    Returns (filename, violations, seen_files, timing) where violations is a
+    list with the violations of each AST check, in the order of
+    checker.ast_checks, and timing is the (parse, walk) time pair or None.
+    """
+    filename, only_files = task
+    for check in _checker.ast_checks:
+        check.violations.clear()
+    _checker.timings = {}
+    seen_files = _checker._processAstWalk(filename, only_files)
+    violations = [list(check.violations) for check in _checker.ast_checks]
+    return filename, violations, seen_files, _checker.timings.get(filename)
+
+
+def jobCount(jobs):
+    """Return the number of worker processes to use for jobs, 0 means all CPUs."""
+    if jobs > 0:
+        return jobs
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+class TranslationUnitPool(object):
+    """Pool of worker processes for parsing and walking translation units."""
+
+    def __init__(self, checker, jobs):
+        self.checker = checker
+        self.jobs = jobCount(jobs)
+
+    def run(self, tasks):
+        """Walk the (filename, only_files) tasks, merge results into the checker.
+
+        Results are merged in the order of tasks, independent of the order in
+        which the workers finish.  Yields (filename, seen_files) for each task.
+        """
+        logging.info('Processing %d translation units with %d jobs.',
+                     len(tasks), self.jobs)
+        # The workers create their own Index, also if the parent already has
+        # one, e.g. from a serial round before.
+        self.checker.provider.releaseIndex()
+        pool = multiprocessing.Pool(self.jobs, _initWorker, (self.checker,))
+        try:
+            for result in pool.imap(_walkTranslationUnit, tasks, 1):
+                self._merge(*result)
+                yield result[0], result[2]
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    def _merge(self, filename, violations, seen_files, timing):
+        logging.debug('Merging results for %s.', filename)
+        for check, vs in zip(self.checker.ast_checks, violations):
+            check.violations.update(vs)
+        self.checker.seen_files |= seen_files
+        if timing:
+            self.checker.timings[filename] = timing
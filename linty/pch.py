@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+"""Automatic precompiled headers for translation units with common includes.
+
+Translation units are grouped by the block of #include directives at their
+start.  For each group with at least min_group_size members, the included
+headers are precompiled once and each translation unit of the group is parsed
+with -include-pch.  The precompiled headers are cached on disk, keyed by the
+hashes of the headers (and the in-scope files they include), the clang
+arguments, the linty version and the libclang version.
+"""
+
+__author__ = 'Manuel Holtgrewe <manuel.holtgrewe@fu-berlin.de>'
+
+import hashlib
+import logging
+import os
+import os.path
+
+import clang.cindex as ci
+
+import cache as lc
+import version
+
+
+def hasFatalErrors(translation_unit):
+    """Return True if parsing the translation unit failed fatally."""
+    for diagnostic in translation_unit.diagnostics:
+        if diagnostic.severity >= ci.Diagnostic.Fatal:
+            return True
+    return False
+
+
+# Words in the messages of clang about unusable precompiled headers, e.g.
+# "file 'a.h' has been modified since the precompiled header 'b.pch' was built".
+PCH_DIAGNOSTIC_WORDS = ('precompiled header', 'PCH file', 'AST file')
+
+
+def hasPchErrors(translation_unit, pch_path):
+    """Return True if clang rejected the precompiled header at pch_path.
+
+    Other errors, e.g. missing includes of the file itself, do not count.
+    """
+    for diagnostic in translation_unit.diagnostics:
+        if diagnostic.severity < ci.Diagnostic.Error:
+            continue
+        spelling = diagnostic.spelling
+        if pch_path in spelling or any(x in spelling for x in PCH_DIAGNOSTIC_WORDS):
+            return True
+    return False
+
+
+class PrecompiledHeaders(object):
+    """Build and cache precompiled headers in directory.
+
+    The include block of each file is read with the IncludeScanner scanner.
+    At most max_headers precompiled headers are kept, the least recently used
+    ones are removed first.
+    """
+
+    def __init__(self, directory, scanner, min_group_size=2, max_headers=16):
+        self.directory = directory
+        self.scanner = scanner
+        self.min_group_size = min_group_size
+        self.max_headers = max_headers
+
+    def prefix(self, path):
+        """Return the header that includes the leading includes of path.
+
+        Resolved includes are included by absolute path, so the header is
+        the same for files in different directories.
+        """
+        lines = []
+        for quote, spelling, resolved in self.scanner.leadingIncludes(path):
+            if resolved:
+                lines.append('#include "%s"' % resolved)
+            elif quote == '<':
+                lines.append('#include <%s>' % spelling)
+            else:
+                break  # Cannot be included from another directory.
+        return ''.join(x + '\n' for x in lines)
+
+    def assign(self, files, clang_args, index):
+        """Return dict that maps files to the precompiled header to use.
+
+        clang_args(filename) returns the arguments for parsing filename, only
+        files with the same arguments share precompiled headers.  The headers
+        are built with the Index index.
+        """
+        groups = {}
+        for filename in files:
+            prefix = self.prefix(filename)
+            if prefix:
+                key = (prefix, tuple(clang_args(filename)))
+                groups.setdefault(key, []).append(filename)
+        result = {}
+        for (prefix, args), members in sorted(groups.items()):
+            if len(members) < self.min_group_size:
+                continue
+            pch_path = self.build(prefix, list(args), index)
+            if pch_path:
+                for filename in members:
+                    result[filename] = pch_path
+        self._prune(set(result.values()))
+        return result
+
+    def build(self, prefix, args, index):
+        """Return path to the precompiled prefix header, build it with index if needed.
+
+        Returns None if the header could not be precompiled.
+        """
+        base = os.path.join(self.directory, self._key(prefix, args))
+        header_path, pch_path = base + '.h', base + '.pch'
+        if os.path.exists(pch_path):
+            os.utime(pch_path, None)  # Mark as recently used.
+            return pch_path
+        logging.info('Building precompiled header %s.', pch_path)
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        with open(header_path, 'wb') as f:
+            f.write(prefix)
+        translation_unit = index.parse(header_path, args=args + ['-x', 'c++-header'],
+                                       options=ci.TranslationUnit.PARSE_INCOMPLETE)
+        if not translation_unit or hasFatalErrors(translation_unit):
+            logging.warning('Could not precompile %s.', header_path)
+            return None
+        if not lc.atomicWrite(pch_path, translation_unit.save):
+            logging.warning('Could not save precompiled header %s.', pch_path)
+            return None
+        return pch_path
+
+    def discard(self, pch_path):
+        """Remove a precompiled header that clang rejected, e.g. as outdated."""
+        logging.warning('Discarding precompiled header %s.', pch_path)
+        try:
+            os.unlink(pch_path)
+        except OSError:
+            pass  # Removed concurrently.
+
+    def _key(self, prefix, args):
+        h = hashlib.sha1(version.__version__)
+        h.update('\0' + (ci.get_version() or ''))
+        h.update('\0' + repr(list(args)))
+        h.update('\0' + prefix)
+        headers = set()
+        for path in self._headers(prefix):
+            headers.add(path)
+            headers |= self.scanner.inScopeClosure(path)
+        for path in sorted(headers):
+            with open(path, 'rb') as f:
+                h.update('\0%s\0%s' % (path, hashlib.sha1(f.read()).hexdigest()))
+        return h.hexdigest()
+
+    def _headers(self, prefix):
+        """Return the resolved headers included by the prefix header."""
+        return [line[len('#include "'):-1] for line in prefix.splitlines()
+                if line.startswith('#include "')]
+
+    def _prune(self, used):
+        if not os.path.isdir(self.directory):
+            return
+        paths = [os.path.join(self.directory, x) for x in os.listdir(self.directory)
+                 if x.endswith('.pch') and os.path.join(self.directory, x) not in used]
+        paths.sort(key=os.path.getmtime, reverse=True)
+        for pch_path in paths[max(0, self.max_headers - len(used)):]:
+            logging.debug('Removing precompiled header %s.', pch_path)
+            for path in (pch_path, pch_path[:-len('.pch')] + '.h'):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
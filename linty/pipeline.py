@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""Pipeline stages for overlapping parsing, walking and text checks.
+
+libclang is called through ctypes which releases the GIL, so parsing the next
+translation unit in a thread overlaps with walking the current one.  The text
+checks of a file run in another thread as soon as the file is first seen.
+"""
+
+__author__ = 'Manuel Holtgrewe <manuel.holtgrewe@fu-berlin.de>'
+
+import logging
+import os.path
+import Queue
+import sys
+import threading
+
+
+def prefetch(parse, tasks):
+    """Yield (task, parse(task)) for all tasks, parsing ahead in a thread.
+
+    While the caller processes the result for one task, the next task is
+    already parsed.  Exceptions from parse() are re-raised in the caller.  If
+    the caller stops early, e.g. on an error, or closes the generator, the
+    parsing thread is stopped and joined.
+    """
+    queue = Queue.Queue(1)
+    stop = threading.Event()
+
+    def producer():
+        for task in tasks:
+            if stop.is_set():
+                return
+            try:
+                queue.put((task, parse(task), None))
+            except Exception:
+                queue.put((task, None, sys.exc_info()))
+                return
+        queue.put(None)
+
+    thread = threading.Thread(target=producer, name='linty-parse')
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item = queue.get()
+            if item is None:
+                break
+            task, parsed, exc_info = item
+            if exc_info:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            yield task, parsed
+    finally:
+        # Drop the results parsed ahead, they keep translation units alive.
+        stop.set()
+        while thread.is_alive():
+            try:
+                queue.get(timeout=0.1)
+            except Queue.Empty:
+                pass
+        thread.join()
+
+
+class TextCheckStage(object):
+    """Run the text checks on each accepted file once, as soon as it is seen.
+
+    process(filename) runs the checks, accept(filename) decides whether a file
+    is checked at all.  If threaded is True then the checks run in a
+    background thread, otherwise directly in submit().
+    """
+
+    def __init__(self, process, accept, threaded=True):
+        self.process = process
+        self.accept = accept
+        self.submitted = set()
+        self._queue = None
+        self._thread = None
+        self._exc_info = None
+        if threaded:
+            self._queue = Queue.Queue()
+            self._thread = threading.Thread(target=self._run, name='linty-text')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def submit(self, filename):
+        """Schedule text checks for filename unless it was submitted before.
+
+        Files are the same if their absolute paths are, the first spelling
+        submitted is checked.
+        """
+        path = os.path.abspath(filename)
+        if path in self.submitted:
+            return
+        self.submitted.add(path)
+        if not self.accept(filename):
+            logging.debug('No check for %s', filename)
+            return
+        if self._queue:
+            self._queue.put(filename)
+        else:
+            self.process(filename)
+
+    def finish(self):
+        """Wait for all submitted checks, re-raise exceptions from the thread."""
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+
+    def _run(self):
+        while True:
+            filename = self._queue.get()
+            if filename is None:
+                return
+            if self._exc_info:
+                continue  # Drain the queue after an error.
+            try:
+                logging.debug('Simple checks on %s', filename)
+                self.process(filename)
+            except Exception:
+                self._exc_info = sys.exc_info()
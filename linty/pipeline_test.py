@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""Tests for the pipeline module in nosetests style."""
+
+import threading
+
+import pipeline as lpl
+
+
+def _consume(iterable, timeout=10):
+    """Return (items, exception) of iterating iterable, fail if it hangs."""
+    result = {'items': [], 'exception': None}
+
+    def consumer():
+        try:
+            for item in iterable:
+                result['items'].append(item)
+        except Exception, e:
+            result['exception'] = e
+
+    thread = threading.Thread(target=consumer)
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), 'Consumer hangs.'
+    return result['items'], result['exception']
+
+
+def test_prefetch():
+    items, exception = _consume(lpl.prefetch(lambda x: x * x, [1, 2, 3]))
+    assert items == [(1, 1), (2, 4), (3, 9)]
+    assert exception is None
+
+
+def test_prefetch_reraises_parse_errors():
+    def parse(x):
+        if x == 2:
+            raise ValueError('Cannot parse %d.' % x)
+        return x * x
+
+    items, exception = _consume(lpl.prefetch(parse, [1, 2, 3]))
+    assert items == [(1, 1)]
+    assert isinstance(exception, ValueError)
+    assert str(exception) == 'Cannot parse 2.'
+
+
+def test_prefetch_stops_parsing_when_consumer_fails():
+    parsed = []
+
+    def parse(x):
+        parsed.append(x)
+        return x
+
+    walks = lpl.prefetch(parse, range(100))
+    try:
+        for task, result in walks:
+            raise ValueError('Cannot walk %d.' % task)
+    except ValueError:
+        pass
+    walks.close()
+    assert not [t for t in threading.enumerate() if t.name == 'linty-parse']
+    assert len(parsed) <= 3
+
+
+def test_text_check_stage():
+    for threaded in (False, True):
+        processed = []
+        stage = lpl.TextCheckStage(processed.append, lambda x: x.endswith('.h'), threaded)
+        for filename in ['a.h', 'b.cpp', 'a.h', 'c.h']:
+            stage.submit(filename)
+        stage.finish()
+        assert processed == ['a.h', 'c.h']
+
+
+def test_text_check_stage_reraises_errors():
+    def process(filename):
+        raise ValueError('Cannot check %s.' % filename)
+
+    stage = lpl.TextCheckStage(process, lambda x: True)
+    stage.submit('a.h')
+    stage.submit('b.h')
+    try:
+        stage.finish()
+        assert False, 'Expected ValueError.'
+    except ValueError, e:
+        assert str(e) == 'Cannot check a.h.'
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""Cost-aware ordering and sharding of translation units.
+
+The CostHistory records the parse and walk time of each translation unit in a
+small JSON file.  The Scheduler uses these times from previous runs to start
+the most expensive translation units first.  Files without history are
+estimated from their size and the number and size of the files they include.
+The Scheduler also splits the translation units into balanced shards for
+running linty on multiple machines.
+"""
+
+__author__ = 'Manuel Holtgrewe <manuel.holtgrewe@fu-berlin.de>'
+
+import json
+import logging
+import os
+import os.path
+
+import cache as lc
+import includes as lincl
+
+
+class CostHistory(object):
+    """Parse and walk times of translation units from previous runs.
+
+    The history file is a JSON object that maps absolute paths to objects
+    with the keys 'parse' and 'walk' (seconds).
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    self.entries = json.load(f)
+            except (IOError, ValueError), e:
+                logging.warning('Ignoring invalid history file %s: %s', path, e)
+
+    def record(self, filename, parse_time, walk_time):
+        """Record the times for the translation unit filename."""
+        self.entries[os.path.abspath(filename)] = {'parse': parse_time,
+                                                   'walk': walk_time}
+
+    def cost(self, filename):
+        """Return recorded parse plus walk time of filename or None."""
+        entry = self.entries.get(os.path.abspath(filename))
+        if entry is None:
+            return None
+        return entry['parse'] + entry['walk']
+
+    def save(self):
+        """Write history to self.path, atomically replacing the old file."""
+        if not self.path:
+            return
+        lc.atomicWriteJson(self.path, self.entries, indent=1, sort_keys=True)
+
+
+class Scheduler(object):
+    """Order translation units by their expected cost, most expensive first."""
+
+    # Cost model for files without history, in seconds.
+    SECONDS_PER_BYTE = 1e-5
+    SECONDS_PER_INCLUDE = 0.02
+
+    def __init__(self, history=None, scanner=None):
+        self.history = history or CostHistory()
+        self.scanner = scanner
+        self._scale = 1.0
+
+    def staticEstimate(self, filename):
+        """Estimate cost of filename from file sizes and include count only.
+
+        The result does not depend on the history and is thus the same on all
+        machines for the same source tree.
+        """
+        paths = [filename]
+        if self.scanner:
+            paths += sorted(self.scanner.closure(filename))
+        size = sum(lincl.fileSize(x) for x in paths)
+        return size * self.SECONDS_PER_BYTE + (len(paths) - 1) * self.SECONDS_PER_INCLUDE
+
+    def estimate(self, filename):
+        """Estimate cost of filename, using the history if possible."""
+        cost = self.history.cost(filename)
+        if cost is not None:
+            return cost
+        return self._scale * self.staticEstimate(filename)
+
+    def order(self, files):
+        """Return files sorted by decreasing estimated cost.
+
+        Ties are broken by the original order, so the result is deterministic.
+        """
+        self._scale = self._calibrate(files)
+        keyed = [(-self.estimate(x), i, x) for i, x in enumerate(files)]
+        return [x for _, _, x in sorted(keyed)]
+
+    def weight(self, filename, weight):
+        """Return weight of filename for sharding.
+
+        weight is one of 'count' (all files weigh the same), 'size' (static
+        estimate) and 'cost' (estimate using the history).  Only 'count' and
+        'size' are guaranteed to give the same result on all machines.
+        """
+        if weight == 'count':
+            return 1
+        elif weight == 'size':
+            return self.staticEstimate(filename)
+        assert weight == 'cost'
+        return self.estimate(filename)
+
+    def shard(self, files, index, count, weight='size'):
+        """Return the files of the shard index (0-based) of count shards.
+
+        The files are partitioned deterministically: the heaviest files are
+        assigned first, each to the shard with the smallest total weight so
+        far.  The files of the shard are returned in their original order.
+        """
+        if weight == 'cost':
+            self._scale = self._calibrate(files)
+        loads = [0] * count
+        shards = [[] for _ in range(count)]
+        keyed = sorted((-self.weight(x, weight), i) for i, x in enumerate(files))
+        for negative_weight, i in keyed:
+            j = min(range(count), key=lambda k: (loads[k], k))
+            loads[j] -= negative_weight
+            shards[j].append(i)
+        logging.info('Shard %d/%d has %d of %d translation units.',
+                     index + 1, count, len(shards[index]), len(files))
+        return [files[i] for i in sorted(shards[index])]
+
+    def _calibrate(self, files):
+        """Return factor that scales static estimates to recorded costs."""
+        recorded, estimated = 0.0, 0.0
+        for path in files:
+            cost = self.history.cost(path)
+            if cost is not None:
+                recorded += cost
+                estimated += self.staticEstimate(path)
+        if not recorded or not estimated:
+            return 1.0
+        return recorded / estimated
+
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""Tests for the schedule module in nosetests style."""
+
+import os
+import os.path
+
+import schedule as ls
+import test_utils as lt
+
+
+def _sizedFiles(sizes):
+    """Return files (dict path -> contents) with the given sizes."""
+    return dict(('file%d.cpp' % i, 'x' * size) for i, size in enumerate(sizes))
+
+
+def _paths(root, sizes):
+    """Return the paths of the files of _sizedFiles(sizes) in root."""
+    return [os.path.join(root, 'file%d.cpp' % i) for i in range(len(sizes))]
+
+
+def test_cost_history_roundtrip():
+    with lt.temporaryTree({}) as root:
+        path = os.path.join(root, 'cache', 'history.json')
+        history = ls.CostHistory(path)
+        history.record('a.cpp', 1.5, 0.5)
+        history.save()
+        assert ls.CostHistory(path).cost('a.cpp') == 2.0
+        assert ls.CostHistory(path).cost('b.cpp') is None
+
+
+def test_scheduler_order_falls_back_to_size():
+    sizes = [10, 1000, 100]
+    with lt.temporaryTree(_sizedFiles(sizes)) as root:
+        paths = _paths(root, sizes)
+        scheduler = ls.Scheduler()
+        assert scheduler.order(paths) == [paths[1], paths[2], paths[0]]
+
+
+def test_scheduler_order_uses_history():
+    sizes = [10, 1000, 100]
+    with lt.temporaryTree(_sizedFiles(sizes)) as root:
+        paths = _paths(root, sizes)
+        history = ls.CostHistory()
+        history.record(paths[0], 10.0, 5.0)
+        history.record(paths[1], 0.5, 0.5)
+        history.record(paths[2], 2.0, 1.0)
+        scheduler = ls.Scheduler(history)
+        assert scheduler.order(paths) == [paths[0], paths[2], paths[1]]
+
+
+def test_scheduler_shards_partition_files():
+    sizes = [10, 1000, 100, 500, 400, 50]
+    with lt.temporaryTree(_sizedFiles(sizes)) as root:
+        paths = _paths(root, sizes)
+        scheduler = ls.Scheduler()
+        shards = [scheduler.shard(paths, i, 3) for i in range(3)]
+        assert sorted(sum(shards, [])) == sorted(paths)
+        assert shards[0] == [paths[1]]
+        assert shards[1] == [paths[3], paths[5]]
+        assert shards[2] == [paths[0], paths[2], paths[4]]
+
+
+def test_scheduler_shards_by_count():
+    sizes = [10, 1000, 100, 500]
+    with lt.temporaryTree(_sizedFiles(sizes)) as root:
+        paths = _paths(root, sizes)
+        scheduler = ls.Scheduler()
+        assert scheduler.shard(paths, 0, 2, 'count') == [paths[0], paths[2]]
+        assert scheduler.shard(paths, 1, 2, 'count') == [paths[1], paths[3]]
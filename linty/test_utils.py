@@ -1,34 +1,58 @@
 #!/usr/env/bin python
 """Utility code for the linty tests."""
 
+import contextlib
 import logging
+import shutil
 import tempfile
 import os
 import os.path
 
-import main as lm
-
 class Data(object):
     def __init__(self, **kwargs):
         self.__dict__.update(kwargs)
 
 
-def checkTUStr(cppStr, ast_check=None, file_check=None, config={}):
+@contextlib.contextmanager
+def temporaryTree(files):
+    """Create files (dict path -> contents) in a temporary directory.
+
+    Yields the path to the directory, it is removed afterwards.
+    """
+    root = tempfile.mkdtemp()
+    try:
+        for path, contents in files.items():
+            path = os.path.join(root, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as f:
+                f.write(contents)
+        yield root
+    finally:
+        shutil.rmtree(root)
+
+
+def checkTUStr(cppStr, ast_check=None, file_check=None, config={}, unsaved=False):
     """Run check on the C++ program given as the string cppStr.
 
+    If unsaved is True then cppStr is passed as an unsaved file, without
+    writing it to disk.
+
     Returns a set with the violations.
     """
+    # Loads libclang, the other tests run without it.
+    import main as lm
     # Create temporary file.
     tmp_file_name = tempfile.mktemp('.cpp')
     try:
-        tmp_file = open(tmp_file_name, 'w+b')
-        tmp_file.write(cppStr)
-        tmp_file.seek(0)
+        if not unsaved:
+            with open(tmp_file_name, 'wb') as tmp_file:
+                tmp_file.write(cppStr)
         # TODO(holtgrew): We need to restore the level again.
         logging.basicConfig(level=logging.ERROR)
 
         # Setup Checker, especially options.
-        options = Data(include_dirs=[os.path.dirname(tmp_file.name)],
+        options = Data(include_dirs=[os.path.dirname(tmp_file_name)],
                        ignore_nolint=False,
                        show_source=False,
                        ignore_rules=[])
@@ -39,11 +63,13 @@ def checkTUStr(cppStr, ast_check=None, file_check=None, config={}):
         if file_check:
             file_checks.append(file_check)
         checker = lm.Checker(options, ast_checks, file_checks)
+        if unsaved:
+            checker.setUnsavedFile(tmp_file_name, cppStr)
                 
-        res = checker.process([tmp_file.name])
-        tmp_file.close()
+        res = checker.process([tmp_file_name])
     finally:
-        os.unlink(tmp_file_name)
+        if os.path.exists(tmp_file_name):
+            os.unlink(tmp_file_name)
         violations = set()
         for check in checker.ast_checks + checker.file_checks:
             violations.update(check.violations)
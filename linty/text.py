@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""Running the text checks without libclang.
+
+The text checks only need the contents of the files.  The TextChecker runs
+them on explicit files and directories, without parsing and without loading
+libclang, e.g. for fast whitespace and header checks in commit hooks.  The
+Checker in main uses it for the files seen in the AST walks.
+"""
+
+__author__ = 'Manuel Holtgrewe <manuel.holtgrewe@fu-berlin.de>'
+
+import logging
+import os
+import os.path
+
+import cache as lc
+import checks as lchk
+import violations as lv
+
+# Files with these extensions are checked in directories.
+SOURCE_EXTENSIONS = ('.c', '.cc', '.cpp', '.cxx', '.h', '.hh', '.hpp', '.hxx', '.inl')
+
+
+class CachingFileReader(object):
+    """Provide cached access to files.
+
+    In-memory contents given with setContents() take precedence over the
+    files on disk.
+    """
+
+    def __init__(self):
+        self._cache = {}
+        self.unsaved_files = {}
+
+    def setContents(self, path, contents):
+        """Use contents instead of the file at path."""
+        path = os.path.abspath(path)
+        self.unsaved_files[path] = contents
+        self._cache[path] = (path, contents, contents.splitlines())
+
+    def addParsedContents(self, path, contents):
+        """Use contents read by the parser unless path was read before."""
+        path = os.path.abspath(path)
+        if not self._cache.has_key(path):
+            self._cache[path] = (path, contents, contents.splitlines())
+
+    def isCached(self, path):
+        return self._cache.has_key(os.path.abspath(path))
+
+    def readFile(self, path):
+        """Reads file at path and returns (npath, contents, lines).
+
+        npath is the normalized absolute path to path.  This method provides
+        cached access to files.  It normalizes the path name to keep duplicates
+        low.  The lines do not contain line breaks, contents is the verbatim
+        file content.
+        """
+        path = os.path.abspath(path)
+        if not self._cache.has_key(path):
+            with open(path, 'rb') as f:
+                fcontents = f.read()
+                flines = [x for x in fcontents.splitlines()]
+            self._cache[path] = (path, fcontents, flines)
+        return self._cache[path]
+
+
+def findFiles(paths, extensions=SOURCE_EXTENSIONS):
+    """Return the files at paths, directories are searched recursively.
+
+    Files in directories are only returned if they have one of the extensions
+    and hidden directories are skipped.  Files given explicitly are always
+    returned.  The result is in order of paths, sorted within directories.
+    """
+    result = []
+    for path in paths:
+        if not os.path.isdir(path):
+            result.append(path)
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames[:] = sorted(x for x in dirnames if not x.startswith('.'))
+            result += [os.path.join(dirpath, x) for x in sorted(filenames)
+                       if os.path.splitext(x)[1] in extensions]
+    return result
+
+
+class TextChecker(object):
+    """Run the text checks file_checks on files.
+
+    With options.cache_dir, the results are cached across runs, see
+    cache.FileCheckCache.
+    """
+
+    def __init__(self, options, file_checks, file_reader=None):
+        self.options = options
+        self.file_checks = file_checks
+        self.file_reader = file_reader or CachingFileReader()
+        self.file_cache = None
+        if getattr(options, 'cache_dir', None):
+            self.file_cache = lc.FileCheckCache(
+                options.cache_dir, file_checks, getattr(options, 'cache_size', 256) * 1024 * 1024)
+
+    def process(self, paths):
+        """Check the files and directories at paths, return the error count."""
+        vs = self.run(findFiles(paths))
+        return lv.reportViolations(vs, self.file_reader, self.options,
+                                   getattr(self.options, 'result_file', None))
+
+    def run(self, files):
+        """Check all files and return the set of violations."""
+        lchk.beginProcessing(self.file_checks, self.file_reader)
+        for filename in files:
+            self.check(filename)
+        self.save()
+        vs = set()
+        for check in self.file_checks:
+            check.finishProcessing()
+            vs.update(check.violations)
+        return vs
+
+    def check(self, filename):
+        """Run the text checks on filename, add to the checks' violations."""
+        if self.file_cache:
+            self._checkCached(filename)
+        else:
+            fpath, fcontent, flines = self.file_reader.readFile(filename)
+            for check in self.file_checks:
+                check.process(fpath, fcontent, flines)
+
+    def save(self):
+        if self.file_cache:
+            self.file_cache.save()
+
+    def _checkCached(self, filename):
+        """Run the text checks on filename unless its results are cached.
+
+        Unchanged files only cost a stat, the violations are taken from the
+        cache and bound to the file name of this run.
+        """
+        fpath = os.path.abspath(filename)
+        digest = self.file_cache.digest(fpath, self.file_reader)
+        cached = self.file_cache.get(digest)
+        if cached is not None and len(cached) == len(self.file_checks):
+            logging.debug('Cached text check results for %s', filename)
+            for check, vs in zip(self.file_checks, cached):
+                for rule_id, line, column, msg in vs:
+                    check.violations.add(lv.RuleViolation(str(rule_id), fpath, line,
+                                                          column, msg))
+            return
+        fpath, fcontent, flines = self.file_reader.readFile(filename)
+        results = []
+        for check in self.file_checks:
+            # Collect the violations of this file separately for the cache.
+            violations, check.violations = check.violations, set()
+            try:
+                check.process(fpath, fcontent, flines)
+            finally:
+                results.append(check.violations)
+                check.violations = violations | check.violations
+        self.file_cache.put(digest, results)
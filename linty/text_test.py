@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""Tests for the text module in nosetests style."""
+
+import os
+import os.path
+
+import checks as lc
+import test_utils as lt
+import text as ltx
+
+
+def test_find_files():
+    files = {'a.cpp': '', 'sub/b.h': '', 'sub/notes.txt': '', '.git/c.h': ''}
+    with lt.temporaryTree(files) as root:
+        notes = os.path.join(root, 'sub', 'notes.txt')
+        assert ltx.findFiles([root, notes]) == [
+            os.path.join(root, 'a.cpp'), os.path.join(root, 'sub', 'b.h'), notes]
+
+
+def test_text_checker_run():
+    with lt.temporaryTree({'a.cpp': 'int x; \n', 'sub/b.h': 'int y;\n'}) as root:
+        options = lt.Data(ignore_nolint=False, show_source=False, ignore_rules=[])
+        checker = ltx.TextChecker(options, [lc.NoTrailingWhitespaceCheck()])
+        checker.file_reader.setContents(os.path.join(root, 'sub', 'b.h'), 'int y;  \n')
+        vs = checker.run(ltx.findFiles([root]))
+        assert sorted((os.path.basename(v.file), v.line) for v in vs) == [
+            ('a.cpp', 1), ('b.h', 1)]
+
+
+def test_text_checker_binds_cached_results_to_file():
+    # Files with the same contents share cache entries.
+    with lt.temporaryTree({'a.h': 'int x;\n', 'b.h': 'int x;\n'}) as root:
+        options = lt.Data(ignore_nolint=False, show_source=False, ignore_rules=[],
+                          cache_dir=os.path.join(root, 'cache'))
+        for name in ['a.h', 'b.h']:
+            path = os.path.join(root, name)
+            checker = ltx.TextChecker(options, [lc.HeaderCheck(lines=['// Header', '//'])])
+            vs = checker.run([path])
+            assert [(v.file, v.rule_id, v.msg) for v in vs] == [
+                (path, 'style.header', 'Missing header!')]
+
+
+def test_caching_file_reader_unsaved_contents():
+    with lt.temporaryTree({'a.cpp': 'int x;\n'}) as root:
+        path = os.path.join(root, 'a.cpp')
+        unsaved = os.path.join(root, 'unsaved.cpp')
+        reader = ltx.CachingFileReader()
+        reader.setContents(unsaved, 'int y;\nint z;\n')
+        reader.setContents(os.path.join(root, 'sub', '..', 'a.cpp'), 'int w;\n')
+        assert reader.readFile(unsaved) == (unsaved, 'int y;\nint z;\n', ['int y;', 'int z;'])
+        assert reader.unsaved_files == {unsaved: 'int y;\nint z;\n', path: 'int w;\n'}
+        # The contents read by the parser do not replace the unsaved ones.
+        reader.addParsedContents(path, 'int x;\n')
+        assert reader.readFile(path)[1] == 'int w;\n'
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+"""Shared token tables for the AST checks.
+
+Tokenizing the extent of each handled node tokenizes the tokens of nested
+nodes again for every enclosing node.  Instead, the TokenIndex of a walk
+tokenizes each file once, on first demand, into a TokenTable sorted by
+offset.  The tokens of an extent are a TokenSlice of this table, found by
+bisecting the offsets of the extent.
+
+The kinds and offsets of the tokens are read in bulk into the arrays of a
+cindex.TokenColumns.  Scans for braces and keywords run on these and on the
+file contents, Token objects are only created for the tokens returned.
+
+Handlers that need the cursors owning the tokens share one annotation of
+the whole file, computed on first demand.  Likewise, the BracketIndex of a
+file matches all its braces, parentheses and square brackets in one pass.
+"""
+
+__author__ = 'Manuel Holtgrewe <manuel.holtgrewe@fu-berlin.de>'
+
+import array
+import bisect
+
+import checks as lc
+
+ci = lc.LazyModule('clang.cindex')
+
+
+class TokenSlice(object):
+    """The tokens [begin, end) of a TokenTable, without copying them.
+
+    Behaves like the TokenCollection returned by cindex.tokenize().
+    """
+
+    def __init__(self, table, begin, end):
+        self.table = table
+        self.begin = begin
+        self.end = end
+
+    def annotate(self):
+        self.table.annotate()
+
+    def get_cursor(self, idx):
+        return self.table.cursor(self.begin + idx)
+
+    def __len__(self):
+        return self.end - self.begin
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            begin, end, step = i.indices(len(self))
+            assert step == 1, 'Only contiguous slices are supported.'
+            return TokenSlice(self.table, self.begin + begin, self.begin + max(begin, end))
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('token index out of range')
+        return self.table.tokens[self.begin + i]
+
+    def find(self, spelling, kind=None):
+        """Return index of the first token with spelling and kind, -1 if none.
+
+        Brackets are looked up in the file's BracketIndex.
+        """
+        if self.table.isBracket(spelling, kind):
+            i = self.table.brackets().first(spelling, self.begin, self.end)
+            return i if i == -1 else i - self.begin
+        for i in xrange(self.begin, self.end):
+            if self.table.matches(i, spelling, kind):
+                return i - self.begin
+        return -1
+
+    def rfind(self, spelling, kind=None):
+        """Return index of the last token with spelling and kind, -1 if none.
+
+        Brackets are looked up in the file's BracketIndex.
+        """
+        if self.table.isBracket(spelling, kind):
+            i = self.table.brackets().last(spelling, self.begin, self.end)
+            return i if i == -1 else i - self.begin
+        for i in xrange(self.end - 1, self.begin - 1, -1):
+            if self.table.matches(i, spelling, kind):
+                return i - self.begin
+        return -1
+
+    def matching(self, i):
+        """Return index of the bracket matching bracket i, None if unmatched.
+
+        The index is relative to this slice, the bracket can be outside.
+        """
+        j = self.table.brackets().match[self.begin + i]
+        if j == -1:
+            return None
+        return j - self.begin
+
+    def __iter__(self):
+        tokens = self.table.tokens
+        for i in xrange(self.begin, self.end):
+            yield tokens[i]
+
+    def __reversed__(self):
+        tokens = self.table.tokens
+        for i in xrange(self.end - 1, self.begin - 1, -1):
+            yield tokens[i]
+
+
+class TokenTable(object):
+    """All tokens of the file filename in translation_unit, sorted by offset.
+
+    contents are the contents of the file.
+    """
+
+    def __init__(self, translation_unit, filename, contents):
+        self.filename = filename
+        file_obj = ci.File.from_name(translation_unit, filename)
+        lines = contents.splitlines() or ['']
+        start = ci.SourceLocation.from_position(translation_unit, file_obj, 1, 1)
+        end = ci.SourceLocation.from_position(translation_unit, file_obj, len(lines),
+                                              len(lines[-1]) + 1)
+        self.contents = contents
+        self.collection = ci.tokenize(translation_unit, ci.SourceRange.from_locations(start, end))
+        self.tokens = self.collection
+        self.columns = self.collection.columns()
+        self.offsets = self.columns.starts
+        self._keywords = None
+        self._brackets = None
+
+    def brackets(self):
+        """Return the BracketIndex of the file, built once."""
+        if self._brackets is None:
+            self._brackets = BracketIndex(self)
+        return self._brackets
+
+    def isBracket(self, spelling, kind=None):
+        """Return True if tokens with spelling and kind are brackets."""
+        return BracketIndex.PAIRS.has_key(spelling) and \
+            (kind is None or kind.value == ci.TokenKind.PUNCTUATION.value)
+
+    def annotate(self):
+        """Annotate all tokens with their cursors, once.
+
+        The keyword tokens are indexed by their spelling and cursor for
+        keywordOf().
+        """
+        if self._keywords is not None:
+            return
+        self.collection.annotate()
+        self._keywords = {}
+        keyword = ci.TokenKind.KEYWORD.value
+        for i, kind in enumerate(self.columns.kinds):
+            if kind == keyword:
+                key = (self.spelling(i),) + self._cursorKey(self.collection.get_cursor(i))
+                self._keywords.setdefault(key, i)
+
+    def cursor(self, i):
+        """Return the cursor of token i."""
+        self.annotate()
+        return self.collection.get_cursor(i)
+
+    def keywordOf(self, cursor, spelling):
+        """Return index of the first keyword spelling owned by cursor, -1 if none.
+
+        E.g. the "while" of a do statement.
+        """
+        self.annotate()
+        return self._keywords.get((spelling,) + self._cursorKey(cursor), -1)
+
+    def _cursorKey(self, cursor):
+        extent = cursor.extent
+        return (cursor.kind.value, extent.start.offset, extent.end.offset)
+
+    def spelling(self, i):
+        """Return the spelling of token i, from the file contents."""
+        return self.contents[self.offsets[i]:self.columns.ends[i]]
+
+    def matches(self, i, spelling, kind=None):
+        """Return True if token i has spelling and the TokenKind kind, if given."""
+        start = self.offsets[i]
+        return ((kind is None or self.columns.kinds[i] == kind.value) and
+                self.columns.ends[i] - start == len(spelling) and
+                self.contents.startswith(spelling, start))
+
+    def slice(self, start_offset, end_offset):
+        """Return TokenSlice of the tokens starting in [start_offset, end_offset)."""
+        begin = bisect.bisect_left(self.offsets, start_offset)
+        end = bisect.bisect_left(self.offsets, end_offset, begin)
+        return TokenSlice(self, begin, end)
+
+
+class BracketIndex(object):
+    """The brackets of a TokenTable and their matches, built in one pass.
+
+    positions maps each bracket spelling to the sorted indices of its tokens,
+    match holds the index of the matching bracket for each token, -1 for
+    unmatched brackets and other tokens.
+    """
+
+    PAIRS = {'{': '}', '(': ')', '[': ']', '}': '{', ')': '(', ']': '['}
+    OPENING = '{(['
+
+    def __init__(self, table):
+        kinds, punctuation = table.columns.kinds, ci.TokenKind.PUNCTUATION.value
+        starts, ends, contents = table.offsets, table.columns.ends, table.contents
+        self.positions = dict((x, array.array('I')) for x in self.PAIRS)
+        self.match = array.array('i', [-1]) * len(starts)
+        stacks = dict((x, []) for x in self.OPENING)
+        for i in xrange(len(starts)):
+            if kinds[i] != punctuation or ends[i] - starts[i] != 1:
+                continue
+            c = contents[starts[i]]
+            if not self.PAIRS.has_key(c):
+                continue
+            self.positions[c].append(i)
+            if c in self.OPENING:
+                stacks[c].append(i)
+            elif stacks[self.PAIRS[c]]:
+                j = stacks[self.PAIRS[c]].pop()
+                self.match[i], self.match[j] = j, i
+
+    def first(self, spelling, begin, end):
+        """Return index of the first bracket spelling in [begin, end), -1 if none."""
+        positions = self.positions[spelling]
+        k = bisect.bisect_left(positions, begin)
+        if k < len(positions) and positions[k] < end:
+            return positions[k]
+        return -1
+
+    def last(self, spelling, begin, end):
+        """Return index of the last bracket spelling in [begin, end), -1 if none."""
+        positions = self.positions[spelling]
+        k = bisect.bisect_left(positions, end)
+        if k > 0 and positions[k - 1] >= begin:
+            return positions[k - 1]
+        return -1
+
+
+class TokenIndex(object):
+    """The TokenTables of the files of a translation unit, built on demand.
+
+    The file contents are read through file_reader, if given.
+    """
+
+    def __init__(self, translation_unit, file_reader=None):
+        self.translation_unit = translation_unit
+        self.file_reader = file_reader
+        self.tables = {}
+
+    def table(self, filename):
+        """Return the TokenTable of filename."""
+        if not self.tables.has_key(filename):
+            self.tables[filename] = TokenTable(self.translation_unit, filename,
+                                               self._read(filename))
+        return self.tables[filename]
+
+    def tokens(self, extent):
+        """Return TokenSlice of the tokens in the SourceRange extent."""
+        start, end = extent.start, extent.end
+        table = self.table(start.file.name)
+        end_offset = len(table.offsets) and (table.offsets[-1] + 1)
+        if end.file and end.file.name == start.file.name:
+            end_offset = end.offset
+        return table.slice(start.offset, end_offset)
+
+    def _read(self, filename):
+        if self.file_reader:
+            return self.file_reader.readFile(filename)[1]
+        with open(filename, 'rb') as f:
+            return f.read()
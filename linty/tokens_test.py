@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""Tests for the tokens module in nosetests style."""
+
+import array
+
+import test_utils as lt
+import tokens as ltok
+
+
+def _withTokenKinds(test):
+    """Run test with the token kinds used in the tables, without libclang."""
+    def wrapper():
+        ci, ltok.ci = ltok.ci, lt.Data(TokenKind=lt.Data(PUNCTUATION=lt.Data(value=0),
+                                                         KEYWORD=lt.Data(value=1)))
+        try:
+            test()
+        finally:
+            ltok.ci = ci
+    wrapper.__name__ = test.__name__
+    return wrapper
+
+
+def _makeTable(contents, starts, ends, kinds):
+    """Return TokenTable without a translation unit, tokens are the spellings."""
+    table = object.__new__(ltok.TokenTable)
+    table.contents = contents
+    table.offsets = array.array('I', starts)
+    table.columns = lt.Data(starts=table.offsets, ends=array.array('I', ends),
+                         kinds=array.array('B', kinds))
+    table.tokens = [contents[s:e] for s, e in zip(starts, ends)]
+    table._keywords = None
+    table._brackets = None
+    return table
+
+
+def test_token_slice():
+    table = _makeTable('a b c d e', [0, 2, 4, 6, 8], [1, 3, 5, 7, 9], [2] * 5)
+    tokens = table.slice(2, 7)
+    assert len(tokens) == 3
+    assert list(tokens) == ['b', 'c', 'd']
+    assert list(reversed(tokens)) == ['d', 'c', 'b']
+    assert tokens[0] == 'b' and tokens[-1] == 'd'
+    assert list(tokens[1:]) == ['c', 'd']
+    assert list(table.slice(3, 3)) == []
+    try:
+        tokens[3]
+        assert False, 'Expected IndexError.'
+    except IndexError:
+        pass
+
+
+@_withTokenKinds
+def test_token_slice_find():
+    # while ( x ) { } }
+    table = _makeTable('while (x) {} }', [0, 6, 7, 8, 10, 11, 13],
+                       [5, 7, 8, 9, 11, 12, 14], [1, 0, 2, 0, 0, 0, 0])
+    assert table.spelling(0) == 'while'
+    tokens = table.slice(0, 13)
+    assert tokens.find('{') == 4
+    assert tokens.rfind('}') == 5
+    assert tokens.find('whi') == -1
+    assert tokens.find('while', lt.Data(value=2)) == -1
+    assert tokens.find('while', lt.Data(value=1)) == 0
+    assert table.slice(6, 14).rfind('(') == 0
+
+
+class FakeCollection(object):
+    def __init__(self, cursors):
+        self.cursors = cursors
+        self.annotated = 0
+
+    def annotate(self):
+        self.annotated += 1
+
+    def get_cursor(self, i):
+        return self.cursors[i]
+
+
+def _makeCursor(kind, start, end):
+    return lt.Data(kind=lt.Data(value=kind), extent=lt.Data(start=lt.Data(offset=start),
+                                                            end=lt.Data(offset=end)))
+
+
+@_withTokenKinds
+def test_token_table_keyword_of():
+    # do while (x); -- the cursors are made up.
+    table = _makeTable('do while (x);', [0, 3, 9, 10, 11, 12],
+                       [2, 8, 10, 11, 12, 13], [1, 1, 0, 2, 0, 0])
+    do_stmt = _makeCursor(202, 0, 13)
+    other = _makeCursor(207, 9, 12)
+    table.collection = FakeCollection([do_stmt, do_stmt, other, other, other, do_stmt])
+    assert table.keywordOf(_makeCursor(202, 0, 13), 'while') == 1
+    assert table.keywordOf(_makeCursor(202, 0, 13), 'do') == 0
+    assert table.keywordOf(other, 'while') == -1
+    assert table.cursor(2) is other
+    assert table.collection.annotated == 1
+
+
+@_withTokenKinds
+def test_bracket_index():
+    # f ( { [ ] } ) } {
+    table = _makeTable('f({[]})}{', range(9), range(1, 10), [2] + [0] * 8)
+    brackets = ltok.BracketIndex(table)
+    assert list(brackets.match) == [-1, 6, 5, 4, 3, 2, 1, -1, -1]
+    assert brackets.first('{', 0, 9) == 2 and brackets.first('{', 3, 8) == -1
+    assert brackets.last('}', 0, 9) == 7 and brackets.last('}', 0, 7) == 5
+    tokens = table.slice(1, 8)
+    assert tokens.find('{') == 1 and tokens.rfind('}') == 6
+    assert tokens.find('}', lt.Data(value=0)) == 4
+    assert tokens.matching(1) == 4 and tokens.matching(6) is None
+    assert table.slice(2, 5).matching(0) == 3
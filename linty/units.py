@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+"""Providers of translation units for the Checker.
+
+The Checker does not parse files itself but asks a provider for translation
+units.  The default TranslationUnitProvider parses each file from scratch.
+The ReparsingProvider keeps recently used translation units alive and only
+reparses them when the file or one of its includes changed, which is used by
+long-running processes such as the linty daemon.  The SerializedAstProvider
+saves parsed translation units as .ast files and loads them in later runs
+instead of parsing again.
+"""
+
+__author__ = 'Manuel Holtgrewe <manuel.holtgrewe@fu-berlin.de>'
+
+import collections
+import hashlib
+import logging
+import os
+import os.path
+import sys
+
+import clang.cindex as ci
+
+import cache as lc
+
+
+def residentMegabytes():
+    """Return the resident memory of this process in MB, None if unknown.
+
+    Without /proc, e.g. on Mac OS X, this is the peak resident memory so far.
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024.0 * 1024.0)
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None  # Not on Unix.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / (1024.0 * 1024.0)  # In bytes.
+    return peak / 1024.0  # In kilobytes.
+
+
+class TranslationUnitProvider(object):
+    """Parse translation units from scratch, sharing one Index.
+
+    The Index is recycled after units_per_index translation units or when the
+    resident memory of the process grew by more than megabytes_per_index
+    since it was created, 0 disables the respective limit.  Translation units keep
+    their Index alive, so recycling does not affect translation units still
+    in use.
+    """
+
+    def __init__(self, units_per_index=64, megabytes_per_index=1024):
+        self.units_per_index = units_per_index
+        self.megabytes_per_index = megabytes_per_index
+        self._index = None
+        self._index_units = 0
+        self._index_megabytes = None
+
+    def parse(self, filename, args, unsaved_files=(), options=0):
+        """Return translation unit for filename, parsed with args.
+
+        unsaved_files is a list of (path, contents) pairs with in-memory
+        contents that replace the files on disk.  options are the
+        TranslationUnit.PARSE_* flags.
+        """
+        return self.index().parse(filename, args=args, unsaved_files=list(unsaved_files),
+                                  options=options)
+
+    def index(self):
+        """Return the shared Index for the next translation unit."""
+        if self._index is not None and self._exhausted():
+            logging.debug('Recycling Index after %d translation units.', self._index_units)
+            self._index = None
+        if self._index is None:
+            # Created lazily, so that worker processes do not share an Index
+            # created before forking.
+            self._index = ci.Index.create()
+            self._index_units = 0
+            self._index_megabytes = residentMegabytes()
+        self._index_units += 1
+        return self._index
+
+    def releaseIndex(self):
+        """Drop the shared Index, e.g. before forking worker processes."""
+        self._index = None
+
+    def _exhausted(self):
+        if self.units_per_index and self._index_units >= self.units_per_index:
+            return True
+        if self.megabytes_per_index and self._index_megabytes is not None:
+            return residentMegabytes() - self._index_megabytes > self.megabytes_per_index
+        return False
+
+
+class ReparsingProvider(TranslationUnitProvider):
+    """Keep recently used translation units alive.
+
+    A translation unit is returned unchanged if neither its main file nor any
+    of its includes changed since it was parsed, and reparsed with
+    TranslationUnit.reparse() otherwise.  Translation units are always
+    reparsed when unsaved files are given or were given for the last parse.
+    At most max_units translation units are kept, the least recently used
+    ones are dropped first.
+    """
+
+    PARSE_OPTIONS = ci.TranslationUnit.PARSE_PRECOMPILED_PREAMBLE
+
+    def __init__(self, max_units=32):
+        super(ReparsingProvider, self).__init__()
+        self.max_units = max_units
+        self.units = collections.OrderedDict()  # (filename, args, options) -> (tu, stamps)
+
+    def parse(self, filename, args, unsaved_files=(), options=0):
+        unsaved_files = list(unsaved_files)
+        key = (os.path.abspath(filename), tuple(args), options)
+        translation_unit, stamps = self.units.pop(key, (None, None))
+        if translation_unit and (unsaved_files or self._changed(stamps)):
+            logging.info('Reparsing %s.', filename)
+            if not translation_unit.reparse(unsaved_files):
+                translation_unit = None
+        elif translation_unit:
+            logging.info('Reusing translation unit for %s.', filename)
+        if not translation_unit:
+            translation_unit = self.index().parse(filename, args=args,
+                                                  unsaved_files=unsaved_files,
+                                                  options=self.PARSE_OPTIONS | options)
+        if translation_unit:
+            stamps = None  # Reparse from disk next time.
+            if not unsaved_files:
+                stamps = self.stamps(translation_unit)
+            self.units[key] = (translation_unit, stamps)
+        elif not unsaved_files:
+            # Parse again only after the file changed, see outdated().
+            self.units[key] = (None, {key[0]: lc.fileStamp(key[0])})
+        while len(self.units) > self.max_units:
+            self.units.popitem(last=False)
+        return translation_unit
+
+    def outdated(self, filenames):
+        """Return the filenames that are not cached or changed since parsing.
+
+        Files that could not be parsed are outdated once they changed.
+        """
+        stamps = {}
+        for key, (translation_unit, unit_stamps) in self.units.items():
+            stamps[key[0]] = unit_stamps
+        return [x for x in filenames
+                if self._changed(stamps.get(os.path.abspath(x), {x: None}))]
+
+    def stamps(self, translation_unit):
+        """Return dict with the stamps of all files of the unit, see cache.fileStamp()."""
+        paths = [translation_unit.spelling]
+        paths += [x.include.name for x in translation_unit.get_includes()]
+        return dict((x, lc.fileStamp(x)) for x in paths)
+
+    def _changed(self, stamps):
+        if stamps is None:
+            return True
+        for path, stamp in stamps.items():
+            if lc.fileStamp(path) != stamp:
+                return True
+        return False
+
+
+class SerializedAstProvider(TranslationUnitProvider):
+    """Save translation units as .ast files and load them in later runs.
+
+    After parsing, the translation unit is saved with TranslationUnit.save().
+    A manifest records the main file and all its includes with their content
+    hashes.  While none of them changed, the translation unit is loaded with
+    Index.read() instead.  The .ast files are named by the hashes and the
+    arguments.  Files are parsed by provider if the .ast file cannot be used
+    or unsaved files are given.
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, provider=None):
+        super(SerializedAstProvider, self).__init__()
+        self.entries = lc.DiskCache(os.path.join(directory, 'ast'), max_bytes)
+        self.provider = provider or TranslationUnitProvider()
+        self._digests = {}  # path -> (stamp, digest)
+
+    def parse(self, filename, args, unsaved_files=(), options=0):
+        unsaved_files = list(unsaved_files)
+        if unsaved_files:
+            return self.provider.parse(filename, args, unsaved_files, options)
+        key = self._manifestKey(filename, args, options)
+        manifest = self.entries.get(key)
+        read_failed = False
+        if manifest and self._unchanged(manifest['dependencies']):
+            translation_unit = self.provider.index().read(self.entries.filePath(manifest['ast']))
+            if translation_unit:
+                logging.info('Loaded %s from %s.', filename, manifest['ast'])
+                return translation_unit
+            # E.g. libclang rejects the .ast file because an include was touched.
+            logging.info('Could not load %s, saving it again.', manifest['ast'])
+            read_failed = True
+        translation_unit = self.provider.parse(filename, args, options=options)
+        if translation_unit:
+            self._save(key, filename, args, options, translation_unit, read_failed)
+        return translation_unit
+
+    def index(self):
+        return self.provider.index()
+
+    def releaseIndex(self):
+        self.provider.releaseIndex()
+
+    def _save(self, key, filename, args, options, translation_unit, overwrite=False):
+        """Save the translation unit, overwrite an existing .ast file if overwrite."""
+        paths = [os.path.abspath(filename)]
+        paths += [os.path.abspath(x.include.name) for x in translation_unit.get_includes()]
+        dependencies = []
+        h = hashlib.sha1('%r\0%d' % (list(args), options))
+        for path in sorted(set(paths)):
+            stamp, digest = self._digest(path)
+            dependencies.append([path, stamp, digest])
+            h.update('\0%s\0%s' % (path, digest))
+        name = h.hexdigest() + '.ast'
+        path = self.entries.filePath(name)
+        if overwrite or not os.path.exists(path):
+            is_new = not os.path.exists(path)
+            if not lc.atomicWrite(path, translation_unit.save):
+                logging.warning('Could not save translation unit of %s.', filename)
+                return
+            if is_new:
+                self.entries.fileAdded(path)
+        self.entries.put(key, {'ast': name, 'dependencies': dependencies})
+
+    def _unchanged(self, dependencies):
+        for path, stamp, digest in dependencies:
+            if lc.fileStamp(path) == stamp:
+                continue  # Not even touched.
+            if self._digest(path)[1] != digest:
+                logging.debug('Saved translation unit outdated by %s.', path)
+                return False
+        return True
+
+    def _digest(self, path):
+        """Return (stamp, content hash) of path, only hash changed files."""
+        stamp = lc.fileStamp(path)
+        if stamp is None:
+            return None, None
+        if self._digests.get(path, (None,))[0] != stamp:
+            with open(path, 'rb') as f:
+                self._digests[path] = (stamp, hashlib.sha1(f.read()).hexdigest())
+        return self._digests[path]
+
+    def _manifestKey(self, filename, args, options):
+        return hashlib.sha1('%s\0%r\0%d' % (os.path.abspath(filename), list(args),
+                                             options)).hexdigest()
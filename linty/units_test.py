@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""Tests for the units module in nosetests style."""
+
+import os
+import os.path
+
+import test_utils as lt
+import units as lu
+
+
+class CountingProvider(lu.TranslationUnitProvider):
+    """Count the files parsed from scratch."""
+
+    def __init__(self):
+        super(CountingProvider, self).__init__()
+        self.parsed = []
+
+    def parse(self, filename, args, unsaved_files=(), options=0):
+        self.parsed.append(filename)
+        return super(CountingProvider, self).parse(filename, args, unsaved_files, options)
+
+
+def _parse(root, filename):
+    """Parse filename with a new SerializedAstProvider, like a new run.
+
+    Returns (translation unit, list of files parsed from scratch).
+    """
+    provider = CountingProvider()
+    saved = lu.SerializedAstProvider(os.path.join(root, 'cache'), provider=provider)
+    return saved.parse(filename, ['-I%s' % root]), provider.parsed
+
+
+def _astFiles(root):
+    """Return the paths of all saved .ast files."""
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(os.path.join(root, 'cache')):
+        paths += [os.path.join(dirpath, x) for x in filenames if x.endswith('.ast')]
+    return paths
+
+
+def _names(translation_unit):
+    """Return the names of the declarations in translation_unit."""
+    return [x.spelling for x in translation_unit.cursor.get_children()]
+
+
+def test_serialized_ast_provider_loads_saved_unit():
+    with lt.temporaryTree({'a.cpp': '#include "h.h"\nint a;\n', 'h.h': 'int h;\n'}) as root:
+        filename = os.path.join(root, 'a.cpp')
+        translation_unit, parsed = _parse(root, filename)
+        assert parsed == [filename]
+        assert len(_astFiles(root)) == 1
+        translation_unit, parsed = _parse(root, filename)
+        assert parsed == []
+        assert _names(translation_unit) == ['h', 'a']
+
+
+def test_serialized_ast_provider_parses_after_header_changed():
+    with lt.temporaryTree({'a.cpp': '#include "h.h"\nint a;\n', 'h.h': 'int h;\n'}) as root:
+        filename = os.path.join(root, 'a.cpp')
+        _parse(root, filename)
+        with open(os.path.join(root, 'h.h'), 'wb') as f:
+            f.write('int h2;\n')
+        translation_unit, parsed = _parse(root, filename)
+        assert parsed == [filename]
+        assert _names(translation_unit) == ['h2', 'a']
+        # Saved for the new contents of the header.
+        assert _parse(root, filename)[1] == []
+
+
+def test_serialized_ast_provider_replaces_corrupt_ast_file():
+    with lt.temporaryTree({'a.cpp': 'int a;\n'}) as root:
+        filename = os.path.join(root, 'a.cpp')
+        _parse(root, filename)
+        path, = _astFiles(root)
+        with open(path, 'wb') as f:
+            f.write('Not an AST file.')
+        translation_unit, parsed = _parse(root, filename)
+        assert parsed == [filename]
+        assert _names(translation_unit) == ['a']
+        # The .ast file was saved again.
+        translation_unit, parsed = _parse(root, filename)
+        assert parsed == []
+        assert _names(translation_unit) == ['a']
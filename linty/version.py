@@ -0,0 +1,4 @@
+#!/usr/bin/env python
+"""Version of linty."""
+
+__version__ = '0.1.0'
@@ -3,6 +3,7 @@
 
 from __future__ import with_statement
 
+import json
 import logging
 import os
 import os.path
@@ -55,11 +56,45 @@ class RuleViolation(object):
                       self.rule_id, self.msg)
 
 
+def violationToList(v):
+    """Convert RuleViolation into a list for JSON serialization."""
+    return [v.rule_id, v.file, v.line, v.column, v.msg]
+
+
+def violationFromList(l):
+    """Convert list from violationToList() back into a RuleViolation."""
+    rule_id, file, line, column, msg = l
+    return RuleViolation(str(rule_id), file and str(file), line, column, msg)
+
+
+def writeResults(path, violations, **info):
+    """Write violations to the result file at path.
+
+    Result files of multiple runs, e.g. of shards, can be merged with
+    readResults().  Additional info is stored alongside the violations.
+    """
+    data = dict(info)
+    data['violations'] = [violationToList(v) for v in sorted(violations)]
+    with open(path, 'wb') as f:
+        json.dump(data, f, indent=1)
+
+
+def readResults(paths):
+    """Read result files written by writeResults(), return merged violations."""
+    violations = set()
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = json.load(f)
+        violations.update(violationFromList(l) for l in data['violations'])
+    return violations
+
+
 class NolintManager(object):
     """Manage the lines ending in '// nolint'."""
 
-    def __init__(self):
+    def __init__(self, file_reader=None):
         self.locations = {}
+        self.file_reader = file_reader
 
     def hasNolint(self, filename, lineno):
         if filename is None:
@@ -68,13 +103,15 @@ class NolintManager(object):
         # Ensure that the nolint lines are registered in self.locations[filename].
         if not self.locations.has_key(filename):
             line_set = set()
-            with open(filename, 'rb') as f:
-                line_no = 0
-                for line in f:
-                    line_no += 1
-                    if line.strip().endswith('// nolint'):
-                        ## print 'nolint', filename, line_no
-                        line_set.add(line_no)
+            if self.file_reader:
+                lines = self.file_reader.readFile(filename)[2]
+            else:
+                with open(filename, 'rb') as f:
+                    lines = f.readlines()
+            for line_no, line in enumerate(lines):
+                if line.strip().endswith('// nolint'):
+                    ## print 'nolint', filename, line_no + 1
+                    line_set.add(line_no + 1)
             self.locations[filename] = line_set
         # Query self.locations[filename].
         return lineno in self.locations[filename]
@@ -82,12 +119,18 @@ class NolintManager(object):
 
 class ViolationPrinter(object):
     def __init__(self, file_reader, ignore_nolint, show_source, ignore_rules):
-      self.nolints = NolintManager()
+      self.nolints = NolintManager(file_reader)
       self.file_reader = file_reader
       self.ignore_nolint = ignore_nolint
       self.show_source = show_source
       self.ignore_rules = set(ignore_rules)
 
+    @classmethod
+    def fromOptions(cls, options, file_reader):
+        """Return printer configured by the command line options."""
+        return cls(file_reader, options.ignore_nolint, options.show_source,
+                   options.ignore_rules)
+
     def show(self, vs):
         previous = None
         violation_count = 0
@@ -111,3 +154,16 @@ class ViolationPrinter(object):
             previous = violation
         print 'Displayed %d violations, skipped %d.' % (violation_count, skipped_count)
 
+
+def reportViolations(vs, file_reader, options, result_file=None, **info):
+    """Write the violations vs to result_file, if any, and print them.
+
+    info is stored in the result file, see writeResults().  Returns the
+    error count for the exit code.
+    """
+    if result_file:
+        # For merging with the results of other shards.
+        writeResults(result_file, vs, **info)
+    logging.info('VIOLATIONS')
+    ViolationPrinter.fromOptions(options, file_reader).show(vs)
+    return int(len(vs) > 0)
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+"""Tests for the violations module in nosetests style."""
+
+import os.path
+import StringIO
+import sys
+
+import test_utils as lt
+import text as ltx
+import violations as lv
+
+
+def test_nolint_manager_reads_unsaved_contents():
+    with lt.temporaryTree({'a.cpp': 'int x;  // nolint\n'}) as root:
+        path = os.path.join(root, 'a.cpp')
+        reader = ltx.CachingFileReader()
+        reader.setContents(path, 'int x;\nint y;  // nolint\n')
+        nolints = lv.NolintManager(reader)
+        assert not nolints.hasNolint(path, 1)
+        assert nolints.hasNolint(path, 2)
+        assert lv.NolintManager().hasNolint(path, 1)
+
+
+def test_report_violations_writes_result_file_and_prints():
+    with lt.temporaryTree({'a.cpp': 'int x; \n'}) as root:
+        path = os.path.join(root, 'a.cpp')
+        vs = set([lv.RuleViolation('whitespace.trailing', path, 1, 7, 'Trailing.')])
+        options = lt.Data(ignore_nolint=False, show_source=False, ignore_rules=[])
+        result_file = os.path.join(root, 'result.json')
+        stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+        try:
+            assert lv.reportViolations(vs, ltx.CachingFileReader(), options, result_file,
+                                       shard=[1, 2]) == 1
+            printed = sys.stdout.getvalue().splitlines()
+        finally:
+            sys.stdout = stdout
+        assert printed[-1] == 'Displayed 1 violations, skipped 0.'
+        assert lv.readResults([result_file]) == vs
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""Watch mode: recheck translation units when they or their includes change.
+
+The Watcher polls the modification times of the checked files and of all
+files they include.  Only the affected translation units are rechecked, using
+TranslationUnit.reparse() with a precompiled preamble, and only the changes
+of the report are printed.
+"""
+
+__author__ = 'Manuel Holtgrewe <manuel.holtgrewe@fu-berlin.de>'
+
+import logging
+import os.path
+import sys
+import time
+
+import main as lm
+import units as lu
+import violations as lv
+
+
+class Watcher(object):
+    """Recheck files whenever they change, print changed violations."""
+
+    def __init__(self, options, ast_checks, file_checks, interval=0.5):
+        self.options = options
+        self.ast_checks = ast_checks
+        self.file_checks = file_checks
+        self.interval = interval
+        # Translation units have to stay in this process for reparsing, one
+        # per checked file to know when it changed.
+        self.options.jobs = 1
+        self.options.unity = 0
+        self.provider = lu.ReparsingProvider(max(32, len(options.filenames)))
+        self.report = set()
+
+    def run(self):
+        """Check all files, then recheck changed ones until interrupted."""
+        outdated = self.options.filenames
+        try:
+            while True:
+                if outdated:
+                    self.check(outdated)
+                time.sleep(self.interval)
+                outdated = self.provider.outdated(self.options.filenames)
+        except KeyboardInterrupt:
+            pass
+        return int(len(self.report) > 0)
+
+    def check(self, files):
+        """Recheck files, update the report and print the changes.
+
+        The violations of all files seen when checking files are replaced.
+        """
+        logging.info('Checking %s.', ', '.join(files))
+        checker = lm.Checker(self.options, self.ast_checks, self.file_checks, self.provider)
+        # Cached walks do not parse, the provider would not know their files.
+        checker.ast_cache = None
+        # The Checker reports files as given or as found by libclang, the
+        # report needs one spelling per file to find the changes.
+        vs = set(self._absolute(v) for v in checker.run(files))
+        seen = set(os.path.abspath(x) for x in list(checker.seen_files) + list(files))
+        report = set(v for v in self.report
+                     if v.file is None or os.path.abspath(v.file) not in seen)
+        report |= vs
+        self._printChanges(checker.file_reader, self.report, report)
+        self.report = report
+
+    def _absolute(self, v):
+        """Return the violation v with the absolute path of its file."""
+        if v.file is None:
+            return v
+        return lv.RuleViolation(v.rule_id, os.path.abspath(v.file), v.line, v.column, v.msg)
+
+    def _printChanges(self, file_reader, old, new):
+        printer = lv.ViolationPrinter.fromOptions(self.options, file_reader)
+        for v in sorted(old - new):
+            if v.rule_id not in printer.ignore_rules:
+                print 'FIXED %s' % v
+        printer.show(new - old)
+        print 'Total %d violations.' % len(new)
+        sys.stdout.flush()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""Tests for the watch module in nosetests style."""
+
+import os
+import os.path
+import StringIO
+import sys
+
+import checks as lc
+import main as lm
+import test_utils as lt
+import watch as lwatch
+import whitespace as lw
+
+
+def _check(watcher, files):
+    """Return the lines printed by watcher.check(files)."""
+    stdout, sys.stdout = sys.stdout, StringIO.StringIO()
+    try:
+        watcher.check(files)
+        return sys.stdout.getvalue().splitlines()
+    finally:
+        sys.stdout = stdout
+
+
+def test_watcher_prints_only_changes():
+    with lt.temporaryTree({'src/a.cpp': 'int x;\n\nint y; \n'}) as root:
+        cwd = os.getcwd()
+        os.chdir(root)
+        try:
+            # Relative paths, as given on the command line.
+            options = lt.Data(filenames=['src/a.cpp'], include_dirs=['src'],
+                              ignore_nolint=False, show_source=False, ignore_rules=[])
+            watcher = lwatch.Watcher(options, [], [lc.NoTrailingWhitespaceCheck()])
+            msg = 'whitespace.trailing : Trailing whitespace is not allowed.'
+            assert _check(watcher, options.filenames) == [
+                '[src/a.cpp:3/7] %s' % msg, 'Displayed 1 violations, skipped 0.',
+                'Total 1 violations.']
+            with open('src/a.cpp', 'wb') as f:
+                f.write('int x; \n\nint y; \n')
+            assert _check(watcher, options.filenames) == [
+                '[src/a.cpp:1/7] %s' % msg, 'Displayed 1 violations, skipped 0.',
+                'Total 2 violations.']
+            with open('src/a.cpp', 'wb') as f:
+                f.write('int x; \n\nint y;\n')
+            assert _check(watcher, options.filenames) == [
+                'FIXED [src/a.cpp:3/7] %s' % msg, 'Displayed 0 violations, skipped 0.',
+                'Total 1 violations.']
+        finally:
+            os.chdir(cwd)
+
+
+def test_reparsing_provider_retries_failed_parse_after_change():
+    with lt.temporaryTree({}) as root:
+        path = os.path.join(root, 'a.cpp')
+        provider = lwatch.lu.ReparsingProvider()
+        assert provider.parse(path, []) is None  # The file does not exist yet.
+        assert provider.outdated([path]) == []
+        with open(path, 'wb') as f:
+            f.write('int x;\n')
+        assert provider.outdated([path]) == [path]
+        assert provider.parse(path, []) is not None
+        assert provider.outdated([path]) == []
+
+
+def test_watcher_parses_cached_files():
+    files = {'src/a.cpp': 'int x;\n', 'src/b.cpp': 'int y;\n'}
+    with lt.temporaryTree(files) as root:
+        names = [os.path.join(root, 'src', x) for x in ('a.cpp', 'b.cpp')]
+        options = lt.Data(filenames=names, include_dirs=[root], ignore_nolint=False,
+                          show_source=False, ignore_rules=[],
+                          cache_dir=os.path.join(root, 'cache'))
+        watcher = lwatch.Watcher(options, [lw.WhitespaceCheck()], [])
+        # Fill the cache with the results of the translation units.
+        lm.Checker(options, [lw.WhitespaceCheck()], []).run(names)
+        _check(watcher, names)
+        # Otherwise they would be rechecked on every poll.
+        assert watcher.provider.outdated(names) == []
+
+
+def test_watcher_parses_unity_members():
+    files = {'src/a.cpp': 'int x;\n', 'src/b.cpp': 'int y;\n'}
+    with lt.temporaryTree(files) as root:
+        names = [os.path.join(root, 'src', x) for x in ('a.cpp', 'b.cpp')]
+        options = lt.Data(filenames=names, include_dirs=[root], ignore_nolint=False,
+                          show_source=False, ignore_rules=[], unity=2)
+        watcher = lwatch.Watcher(options, [lw.WhitespaceCheck()], [])
+        _check(watcher, names)
+        # The members of a batch would be rechecked on every poll.
+        assert watcher.provider.outdated(names) == []
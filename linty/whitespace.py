@@ -8,7 +8,7 @@ import sys
 import violations as lv
 import checks as lc
 
-import clang.cindex as ci
+ci = lc.LazyModule('clang.cindex')
 
 class WhitespaceConfig(object):
     pass
@@ -21,16 +21,7 @@ class WhitespaceNodeHandler(lv.LogViolationsMixin):
         self.node = node
         self.parent = parent
         self.violations = whitespace_check.violations
-        self._token_set = None
-
-    def _getTokenSet(self):
-        if self._token_set:
-            return self._token_set
-        extent = self.node.extent
-        translation_unit = self.node.translation_unit
-        self._token_set = ci.tokenize(translation_unit, extent)
-        return self._token_set
-        
+
     def checkWhitespace(self):
         raise Exception('Abstract method!')
 
@@ -49,92 +40,155 @@ class RootHandler(WhitespaceNodeHandler):
 
 
 class NamespaceHandler(WhitespaceNodeHandler):
+    """Checks the spacing of "namespace <identifier> {" and "}  // namespace <identifier>".
+
+    Only the tokens at both ends of the namespace are fetched, the namespace
+    body (often a whole header) is not tokenized.
+    """
+
+    # Number of tokens fetched at the start and the end of the namespace.
+    HEAD_TOKENS = 8
+    TAIL_TOKENS = 2
+
+    def __init__(self, whitespace_check, handler_name, node, parent):
+        super(NamespaceHandler, self).__init__(whitespace_check, handler_name, node, parent)
+        self._boundary_tokens = None
+
+    def _getBoundaryTokens(self):
+        """Return (head, tail, after), see cindex.tokenize_ends().
+
+        after is the token after the namespace, e.g. the closing comment.  The
+        head is fetched again with more tokens until it contains the opening
+        brace, e.g. after attributes or a long qualified name.
+        """
+        if self._boundary_tokens is None:
+            first = self.HEAD_TOKENS
+            while True:
+                self._boundary_tokens = ci.tokenize_ends(
+                    self.node.translation_unit, self.node.extent,
+                    first, self.TAIL_TOKENS, 1)
+                head = self._boundary_tokens[0]
+                if len(head) < first or self._findLParen(head) != -1:
+                    break
+                first *= 4
+        return self._boundary_tokens
+
+    def _findLParen(self, tokens):
+        """Return index of the first opening curly brace in tokens, -1 if none."""
+        for i, t in enumerate(tokens):
+            if t.kind == ci.TokenKind.PUNCTUATION and t.spelling == '{':
+                return i
+        return -1
+
     def checkWhitespace(self):
-        tokens = self._getTokenSet()
+        head, tail, after = self._getBoundaryTokens()
+        tail = tail + after
         tk = ci.TokenKind
         # --------------------------------------------------------------------
         # Get tokens and log violation on errors.
         # --------------------------------------------------------------------
+        # The inner namespaces of "namespace a::b {" start at the "::" before
+        # their name, they are checked with the outermost one.
+        keyword = head[0]
+        if self._isInnerNamespace(keyword):
+            return
         # Get parenthesis tokens.
-        lparen = self.getLParen()
-        if not lparen:
-            self.logViolation('spacing.namespace', tokens[0],
+        lparen_index = self._findLParen(head)
+        if lparen_index == -1:
+            self.logViolation('spacing.namespace', head[0],
                               'Could not find opening brace for namespace.')
             return
+        lparen = head[lparen_index]
         rparen = self.getRParen()
         if not rparen:
-            self.logViolation('spacing.namespace', tokens[-1],
+            self.logViolation('spacing.namespace', tail[-1],
                               'Could not find closing brace for namespace.')
             return
         # Get namespace keyword token.
-        keyword = tokens[0]
         if keyword.kind != tk.KEYWORD or keyword.spelling != 'namespace':
-            self.logViolation('spacing.namespace', tokens[-1],
+            self.logViolation('spacing.namespace', tail[-1],
                               'First token for namespace construct must be keyword "namespace".')
             return
-        identifier = tokens[1]
-        if identifier.kind != tk.IDENTIFIER:
-            self.logViolation('spacing.namespace', tokens[0],
+        if lparen_index < 2 or head[1].kind != tk.IDENTIFIER:
+            self.logViolation('spacing.namespace', head[0],
                               'Second token for namespace construct must be identifier.')
             return
-        if tokens[2] != lparen:
-            self.logViolation('spacing.namespace', tokens[0],
+        # The name is "b" or, for nested namespaces, "a::b".
+        name = head[1:lparen_index]
+        if not self._isQualifiedName(name):
+            self.logViolation('spacing.namespace', head[0],
                               'Third token for namespace must be opening brace.')
             return
-        if tokens[-2] != rparen:
-            self.logViolation('spacing.namespace', tokens[0],
+        after_keyword, identifier = name[0], name[-1]
+        if len(tail) < 2 or tail[-2] != rparen:
+            self.logViolation('spacing.namespace', head[0],
                               'Second last token for namespace must be right brace.')
             return
-        comment = tokens[-1]
+        comment = tail[-1]
         if comment.kind != tk.COMMENT:
-            self.logViolation('spacing.namespace', tokens[-1],
+            self.logViolation('spacing.namespace', tail[-1],
                               'Last token for namespace must be "// namespace <namespace id>" comment.')
             return
         # --------------------------------------------------------------------
         # Check rules for the namespace construct
         # --------------------------------------------------------------------
         # Exactly one space between namespace and identifier.
-        if keyword.extent.end.line != identifier.extent.end.line:  # On the same line.
-            self.logViolation('spacing.namespace', tokens[0],
+        if keyword.extent.end.line != after_keyword.extent.end.line:  # On the same line.
+            self.logViolation('spacing.namespace', head[0],
                               'Keyword "namespace" must be on same line as identifier.')
             return
-        if keyword.extent.end.column + 1 != identifier.extent.start.column:  # One space.
-            self.logViolation('spacing.namespace', tokens[0],
+        if keyword.extent.end.column + 1 != after_keyword.extent.start.column:  # One space.
+            self.logViolation('spacing.namespace', head[0],
                               'There must be exactly on space between keyword "namespace" and identifier.')
             return
         # Exactly one space between identifier and opening bracket.
         if identifier.extent.end.column + 1 != lparen.extent.start.column:  # One space.
-            self.logViolation('spacing.namespace', tokens[0],
+            self.logViolation('spacing.namespace', head[0],
                               'There must be exactly on space between namespace identifier and opening brace.')
             return
         # Exactly two spaces between closing brace and comment
         if rparen.extent.end.line != comment.extent.end.line:  # On the same line.
-            self.logViolation('spacing.namespace', tokens[0],
+            self.logViolation('spacing.namespace', head[0],
                               'Right parenthesis and comment must be on same line.')
             return
         if rparen.extent.end.column + 2 != comment.extent.start.column:  # Two spaces.
-            self.logViolation('spacing.namespace', tokens[0],
+            self.logViolation('spacing.namespace', head[0],
                               'There must be exactly two spaces between right parenthesis and comment.')
             return
         # Comment must be "// namespace <namespace name>"
         if comment.spelling != '// namespace %s' % identifier.spelling:
-            self.logViolation('spacing.namespace', tokens[0],
+            self.logViolation('spacing.namespace', head[0],
                               'The closing comment must be "// namespace <identifier>".')
             return
 
-    def getLParen(self):  # TODO(holtgrew): Dupe!
-        tk = ci.TokenKind
-        token_set = self._getTokenSet()
-        for t in token_set:
-            if t.kind == tk.PUNCTUATION or t.spelling == '{':
-                return t
-        return None
+    def _isQualifiedName(self, tokens):
+        """Return True if tokens are identifiers separated by "::"."""
+        for i, t in enumerate(tokens):
+            if i % 2 == 0 and t.kind != ci.TokenKind.IDENTIFIER:
+                return False
+            if i % 2 == 1 and t.spelling != '::':
+                return False
+        return len(tokens) % 2 == 1
 
-    def getRParen(self):  # TODO(holtgrew): Dupe!
-        tk = ci.TokenKind
-        token_set = self._getTokenSet()
-        for t in reversed(token_set):
-            if t.kind == tk.PUNCTUATION or t.spelling == '}':
+    def _isInnerNamespace(self, token):
+        """Return True if token starts an inner namespace of "namespace a::b {".
+
+        libclang starts these at the "::" before their name.
+        """
+        return token.kind == ci.TokenKind.PUNCTUATION and token.spelling == '::'
+
+    def getLParen(self):
+        """Return the first opening curly brace or None."""
+        head = self._getBoundaryTokens()[0]
+        i = self._findLParen(head)
+        if i == -1:
+            return None
+        return head[i]
+
+    def getRParen(self):
+        """Return the last closing curly brace or None."""
+        for t in reversed(self._getBoundaryTokens()[1]):
+            if t.kind == ci.TokenKind.PUNCTUATION and t.spelling == '}':
                 return t
         return None
 
@@ -225,6 +279,10 @@ def getHandler(indentation_check, node, parent):
     return res
 
 class WhitespaceCheck(lc.TreeCheck):
+    RUNTIME_ATTRIBUTES = lc.TreeCheck.RUNTIME_ATTRIBUTES + ('handlers', 'level')
+    # Only namespaces are checked, on their tokens.
+    NEEDS_FUNCTION_BODIES = False
+
     def __init__(self, config=WhitespaceConfig()):
         super(WhitespaceCheck, self).__init__()
         self.config = config
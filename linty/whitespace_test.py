@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+"""Tests for the module of whitespace in nosetests style."""
+
+import checks as lc
+import whitespace as lw
+import test_utils as lt
+
+# ============================================================================
+# Tests for the namespace handler.
+# ============================================================================
+
+def test_namespace_correct():
+    cpp_str = """
+namespace foo {
+int x;
+}  // namespace foo
+"""
+    check = lw.WhitespaceCheck(config=lw.WhitespaceConfig())
+    violations = lt.checkTUStr(cpp_str, ast_check=check)
+    # Check resulting violation.
+    assert len(violations) == 0
+
+
+def test_namespace_one_line():
+    cpp_str = """
+namespace foo { int x; }  // namespace foo
+"""
+    check = lw.WhitespaceCheck(config=lw.WhitespaceConfig())
+    violations = lt.checkTUStr(cpp_str, ast_check=check)
+    # Check resulting violation.
+    assert len(violations) == 0
+
+
+def test_namespace_comment_at_end_of_file():
+    # No line break after the closing comment.
+    cpp_str = """
+namespace foo {
+int x;
+}  // namespace foo"""
+    check = lw.WhitespaceCheck(config=lw.WhitespaceConfig())
+    violations = lt.checkTUStr(cpp_str, ast_check=check)
+    # Check resulting violation.
+    assert len(violations) == 0
+
+
+def test_namespace_brace_on_later_line():
+    # The opening brace is behind the first window of lines.
+    cpp_str = """
+namespace foo
+""" + '\n' * 10 + """{
+int x;
+}  // namespace foo
+"""
+    check = lw.WhitespaceCheck(config=lw.WhitespaceConfig())
+    violations = lt.checkTUStr(cpp_str, ast_check=check)
+    # Check resulting violation.
+    assert len(violations) == 1
+    v = list(violations)[0]
+    assert v.rule_id == 'spacing.namespace'
+    assert v.line == 2
+    assert v.msg == ('There must be exactly on space between namespace identifier '
+                     'and opening brace.')
+
+
+def test_namespace_brace_after_long_head():
+    # The opening brace is behind the first window of tokens.
+    cpp_str = """
+namespace a::b::c::d::e {
+int x;
+}  // namespace e
+"""
+    check = lw.WhitespaceCheck(config=lw.WhitespaceConfig())
+    violations = lt.checkTUStr(cpp_str, ast_check=check)
+    # Check resulting violation.
+    assert len(violations) == 0
+
+
+def test_namespace_qualified_name():
+    cpp_str = """
+namespace a::b {
+int x;
+}  // namespace b
+"""
+    check = lw.WhitespaceCheck(config=lw.WhitespaceConfig())
+    violations = lt.checkTUStr(cpp_str, ast_check=check)
+    # Check resulting violation.
+    assert len(violations) == 0
+
+
+def test_namespace_attribute_incorrect():
+    # Only "namespace <identifier> {" is accepted.
+    cpp_str = """
+namespace [[deprecated]] foo {
+int x;
+}  // namespace foo
+"""
+    check = lw.WhitespaceCheck(config=lw.WhitespaceConfig())
+    violations = lt.checkTUStr(cpp_str, ast_check=check)
+    # Check resulting violation.
+    assert len(violations) == 1
+    v = list(violations)[0]
+    assert v.rule_id == 'spacing.namespace'
+    assert v.line == 2
+    assert v.msg == 'Second token for namespace construct must be identifier.'
+
+
+def test_namespace_nested_inline_spacing():
+    # Only "namespace <identifier> {" is accepted, also for nested namespaces.
+    cpp_str = """
+namespace foo {
+inline namespace  bar {
+int x;
+}  // namespace bar
+}  // namespace foo
+"""
+    check = lw.WhitespaceCheck(config=lw.WhitespaceConfig())
+    violations = lt.checkTUStr(cpp_str, ast_check=check)
+    # Check resulting violation.
+    assert len(violations) == 1
+    v = list(violations)[0]
+    assert v.rule_id == 'spacing.namespace'
+    assert v.line == 5
+
+
+def test_namespace_comment_incorrect():
+    cpp_str = """
+namespace foo {
+int x;
+}  // namespace bar
+"""
+    check = lw.WhitespaceCheck(config=lw.WhitespaceConfig())
+    violations = lt.checkTUStr(cpp_str, ast_check=check)
+    # Check resulting violation.
+    assert len(violations) == 1
+    v = list(violations)[0]
+    assert v.rule_id == 'spacing.namespace'
+    assert v.line == 2
+    assert v.msg == 'The closing comment must be "// namespace <identifier>".'
+
+
+# ============================================================================
+# Tests for checking unsaved files.
+# ============================================================================
+
+def test_unsaved_file_ast_check():
+    # The file does not exist on disk.
+    cpp_str = """
+namespace foo {
+int x;
+}  // namespace bar
+"""
+    check = lw.WhitespaceCheck(config=lw.WhitespaceConfig())
+    violations = lt.checkTUStr(cpp_str, ast_check=check, unsaved=True)
+    # Check resulting violation.
+    assert len(violations) == 1
+    v = list(violations)[0]
+    assert v.rule_id == 'spacing.namespace'
+    assert v.line == 2
+
+
+def test_unsaved_file_text_check():
+    cpp_str = '\nint x; \n'  # Trailing space in line 2.
+    check = lc.NoTrailingWhitespaceCheck()
+    violations = lt.checkTUStr(cpp_str, file_check=check, unsaved=True)
+    # Check resulting violation.
+    assert len(violations) == 1
+    v = list(violations)[0]
+    assert v.rule_id == 'whitespace.trailing'
+    assert v.line == 2